@@ -0,0 +1,287 @@
+import os
+import time
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from . import cubo
+from .cache_resultados import memoizar
+from .carregador_dados import ENGINE, INTERVALO_INCREMENTAL, _cache_vendas, dados_vendas_cache, particao_atual
+from .dimensoes import rotulo
+from .esquema import centavos, data_do_ordinal, dia_da_semana, mes_do_ordinal, reais, semana_do_ordinal
+from .instrumentacao import cronometrar
+from .metricas import TabelaFatorada
+from .visoes import fatiar_periodo, vendas_concluidas
+
+# "memoria": agrega o frame residente em pandas | "banco": compila GROUP BY e executa no Postgres
+MODO_AGREGACAO = os.getenv("MODO_AGREGACAO", "memoria")
+
+# Junções usadas pelas agregações feitas no banco (o frame residente guarda só o fato estreito)
+JUNCOES_VENDAS = """
+    FROM
+        sales s
+    JOIN
+        stores st ON s.store_id = st.id
+    LEFT JOIN
+        channels c ON s.channel_id = c.id
+    LEFT JOIN
+        sub_brands sb ON st.sub_brand_id = sb.id
+    LEFT JOIN
+        customers cust ON s.customer_id = cust.id
+"""
+
+FILTRO_CONCLUIDAS = {"sale_status_desc": "COMPLETED"}
+
+
+def versao_dados():
+    """
+    Versão dos dados por trás de agregar(), usada nas chaves do cache de resultados: partição pedida +
+    versão do frame de vendas ou, no modo banco (sem frame residente), a janela de INTERVALO_INCREMENTAL corrente.
+    """
+    if MODO_AGREGACAO == "banco":
+        return ("banco", particao_atual(), int(time.time() // max(INTERVALO_INCREMENTAL, 1)))
+    cache = _cache_vendas()
+    cache.obter()
+    return (particao_atual(), cache.geracao, cache.versao)
+
+
+def _filtros_escopo(modo):
+    """
+    Filtros da partição pedida, quando os dados não vêm dela mesma: no banco (sem frame residente) e
+    quando uma partição maior já em memória foi reaproveitada (escopo_dados(..., reaproveitar=True)).
+    """
+    particao = particao_atual()
+    if modo != "banco" and _cache_vendas().particao == particao:
+        return {}
+    sub_brand, estado = particao
+    return {d: v for d, v in (("sub_brand_id", sub_brand), ("state", estado)) if v is not None}
+
+# nome -> (expressão SQL, coluna do frame, agregação pandas); colunas "_centavos" voltam para reais no fim
+METRICAS = {
+    "faturamento": ("SUM(s.total_amount)", centavos("total_amount"), "sum"),
+    "vendas": ("COUNT(*)", "id", "size"),
+    "desconto": ("SUM(s.total_discount)", centavos("total_discount"), "sum"),
+    "taxa_entrega": ("SUM(s.delivery_fee)", centavos("delivery_fee"), "sum"),
+    "clientes_unicos": ("COUNT(DISTINCT s.customer_id)", "customer_id", "nunique"),
+    "primeira_venda": ("MIN(s.created_at)", "created_at", "min"),
+    "ultima_venda": ("MAX(s.created_at)", "created_at", "max"),
+    "primeiro_dia": ("MIN(CAST(s.created_at AS DATE) - DATE '1970-01-01')", "dia", "min"),
+    "ultimo_dia": ("MAX(CAST(s.created_at AS DATE) - DATE '1970-01-01')", "dia", "max"),
+}
+# métricas derivadas: nome -> (numerador, denominador)
+METRICAS_DERIVADAS = {
+    "ticket_medio": ("faturamento", "vendas"),
+}
+
+
+def _hora(df):
+    return df["hora"] if "hora" in df.columns else df["created_at"].dt.hour
+
+
+def _dia_semana(df):
+    return df["dia_semana"] if "dia_semana" in df.columns else dia_da_semana(df["dia"])
+
+
+def _rotulo(coluna):
+    # rótulos vêm das tabelas de dimensão, resolvidos só para as linhas que chegaram até aqui
+    return lambda df: rotulo(df, coluna)
+
+
+# nome -> (expressão SQL, função que extrai a mesma coluna do frame de vendas)
+DIMENSOES = {
+    "sale_date": ("CAST(s.created_at AS DATE)", lambda df: data_do_ordinal(df["dia"])),
+    # dia ordinal (int32, dias desde 1970-01-01) do esquema: para agrupar e comparar sem converter em datas
+    "dia": ("CAST(s.created_at AS DATE) - DATE '1970-01-01'", lambda df: df["dia"]),
+    "hora": ("CAST(EXTRACT(HOUR FROM s.created_at) AS INTEGER)", _hora),
+    "dia_semana": ("CAST(EXTRACT(ISODOW FROM s.created_at) AS INTEGER) - 1", _dia_semana),
+    "semana": ("CAST(DATE_TRUNC('week', s.created_at) AS DATE)", lambda df: semana_do_ordinal(df["dia"])),
+    "mes": ("CAST(DATE_TRUNC('month', s.created_at) AS DATE)", lambda df: mes_do_ordinal(df["dia"])),
+    "store_id": ("s.store_id", lambda df: df["store_id"]),
+    "store_name": ("st.name", _rotulo("store_name")),
+    "city": ("st.city", _rotulo("city")),
+    "state": ("st.state", _rotulo("state")),
+    "channel_id": ("s.channel_id", lambda df: df["channel_id"]),
+    "channel_name": ("c.name", _rotulo("channel_name")),
+    "sub_brand_id": ("st.sub_brand_id", _rotulo("sub_brand_id")),
+    "sub_brand_name": ("sb.name", _rotulo("sub_brand_name")),
+    "sale_status_desc": ("s.sale_status_desc", lambda df: df["sale_status_desc"]),
+    "customer_id": ("s.customer_id", lambda df: df["customer_id"]),
+    "customer_name": ("COALESCE(cust.customer_name, s.customer_name)", _rotulo("customer_name")),
+    "customer_phone": ("cust.phone_number", _rotulo("customer_phone")),
+}
+
+
+def _validar(metricas, dimensoes, filtros, ordenar_por=None):
+    for m in metricas:
+        if m not in METRICAS and m not in METRICAS_DERIVADAS:
+            raise ValueError(f"Métrica desconhecida: {m}")
+    for d in list(dimensoes) + list(filtros):
+        if d not in DIMENSOES:
+            raise ValueError(f"Dimensão desconhecida: {d}")
+    # vai para o texto do ORDER BY: só os aliases de colunas do próprio resultado
+    if ordenar_por is not None and ordenar_por not in list(metricas) + list(dimensoes):
+        raise ValueError(f"Ordenação por coluna fora do resultado: {ordenar_por}")
+
+
+def _metricas_base(metricas):
+    """Expande as métricas derivadas nas métricas somáveis de que dependem."""
+    base = []
+    for m in metricas:
+        for b in METRICAS_DERIVADAS.get(m, (m,)):
+            if b not in base:
+                base.append(b)
+    return base
+
+
+def _lista(valor):
+    return list(valor) if isinstance(valor, (list, tuple, set)) else None
+
+
+def _agregar_banco(metricas, dimensoes, periodo, filtros, incluir_nulos, ordenar_por, crescente, limite):
+    colunas = [f"{DIMENSOES[d][0]} AS {d}" for d in dimensoes]
+    colunas += [f"{METRICAS[m][0]} AS {m}" for m in metricas]
+
+    condicoes, params, expansiveis = [], {}, []
+    if periodo is not None:
+        condicoes.append("s.created_at >= :data_inicio AND s.created_at < :data_fim")
+        params["data_inicio"] = periodo[0]
+        params["data_fim"] = periodo[1] + timedelta(days=1)
+    for i, (d, valor) in enumerate(filtros.items()):
+        nome = f"filtro_{i}"
+        if _lista(valor) is not None:
+            condicoes.append(f"{DIMENSOES[d][0]} IN :{nome}")
+            params[nome] = _lista(valor)
+            expansiveis.append(nome)
+        else:
+            condicoes.append(f"{DIMENSOES[d][0]} = :{nome}")
+            params[nome] = valor
+    if not incluir_nulos:
+        condicoes += [f"{DIMENSOES[d][0]} IS NOT NULL" for d in dimensoes]
+
+    sql = "SELECT " + ", ".join(colunas) + JUNCOES_VENDAS
+    if condicoes:
+        sql += " WHERE " + " AND ".join(f"({c})" for c in condicoes)
+    if dimensoes:
+        sql += " GROUP BY " + ", ".join(str(i + 1) for i in range(len(dimensoes)))
+    if ordenar_por is not None:
+        sql += f" ORDER BY {ordenar_por} {'ASC' if crescente else 'DESC'}"
+    if limite is not None:
+        sql += " LIMIT :limite"
+        params["limite"] = int(limite)
+
+    consulta = text(sql).bindparams(*[bindparam(n, expanding=True) for n in expansiveis])
+    df = pd.read_sql_query(sql=consulta, con=ENGINE, params=params)
+    # SUM de colunas numeric chega como Decimal
+    for m in metricas:
+        if METRICAS[m][2] in ("sum", "size", "nunique"):
+            df[m] = pd.to_numeric(df[m])
+    return df
+
+
+def _agregar_memoria(metricas, dimensoes, periodo, filtros, incluir_nulos, ordenar_por, crescente, limite):
+    if cubo.cobre(metricas, dimensoes, filtros):
+        resultado = cubo.agregar_cubo(metricas, dimensoes, periodo, filtros, incluir_nulos)
+    else:
+        resultado = _agregar_linhas(metricas, dimensoes, periodo, filtros, incluir_nulos)
+
+    if ordenar_por is not None:
+        resultado = resultado.sort_values(ordenar_por, ascending=crescente)
+    if limite is not None:
+        resultado = resultado.head(limite)
+    return resultado.reset_index(drop=True)
+
+
+def _agregar_linhas(metricas, dimensoes, periodo, filtros, incluir_nulos):
+    if filtros.get("sale_status_desc") == "COMPLETED":
+        # visão compartilhada já filtrada e com hora/dia da semana prontos
+        df = vendas_concluidas()
+        filtros = {d: v for d, v in filtros.items() if d != "sale_status_desc"}
+    else:
+        df = dados_vendas_cache()
+
+    if periodo is not None:
+        df = fatiar_periodo(df, *periodo)
+    if filtros:
+        mascara = pd.Series(True, index=df.index)
+        for d, valor in filtros.items():
+            serie = DIMENSOES[d][1](df)
+            mascara &= serie.isin(_lista(valor)) if _lista(valor) is not None else serie == valor
+        df = df[mascara]
+
+    agregacoes = {m: (METRICAS[m][1], METRICAS[m][2]) for m in metricas}
+    if all(func in ("sum", "size") for _, func in agregacoes.values()):
+        # somas e contagens passam pelo mesmo núcleo do cubo e do contexto da IA
+        tabela = TabelaFatorada(df)
+        for d in dimensoes:
+            if d in df.columns:
+                continue
+            if d in cubo.DERIVADAS_DIA or d in cubo.ROTULOS:
+                cubo.registrar_chave(tabela, d)
+            else:
+                tabela.incluir(d, DIMENSOES[d][1](df))
+        resultado = tabela.agregar({m: None if func == "size" else col for m, (col, func) in agregacoes.items()},
+                                   dimensoes, dropna=not incluir_nulos)
+    elif dimensoes:
+        chaves = [DIMENSOES[d][1](df).rename(d) for d in dimensoes]
+        resultado = df.groupby(chaves, dropna=not incluir_nulos, observed=True).agg(**agregacoes).reset_index()
+    else:
+        resultado = pd.DataFrame([{
+            m: len(df) if func == "size" else df[col].agg(func)
+            for m, (col, func) in agregacoes.items()
+        }])
+    for m, (col, _) in agregacoes.items():
+        if col.endswith("_centavos"):
+            resultado[m] = reais(resultado[m])
+    return resultado
+
+
+@cronometrar("agregar")
+@memoizar("agregacao", versao_dados)
+def agregar(metricas, dimensoes=(), periodo=None, filtros=None, modo=None,
+            incluir_nulos=False, ordenar_por=None, crescente=False, limite=None):
+    """
+    Agrega as vendas por dimensões, no banco ou em memória, e devolve um frame pequeno.
+
+    Args:
+        metricas (list): nomes em METRICAS/METRICAS_DERIVADAS (ex.: ['faturamento', 'vendas']).
+        dimensoes (list): nomes em DIMENSOES (ex.: ['sale_date', 'channel_name']); vazio = total.
+        periodo (tuple[date, date] | None): intervalo fechado de datas da venda.
+        filtros (dict | None): dimensão -> valor ou lista de valores.
+        modo (str | None): "memoria" ou "banco"; padrão MODO_AGREGACAO.
+        incluir_nulos (bool): mantém grupos com dimensão nula (como o GROUP BY do SQL).
+        ordenar_por (str | None), crescente (bool), limite (int | None): top-N.
+
+    Returns:
+        pd.DataFrame: uma coluna por dimensão e por métrica.
+    """
+    modo = modo or MODO_AGREGACAO
+    filtros = {**_filtros_escopo(modo), **(filtros or {})}
+    dimensoes = list(dimensoes)
+    _validar(metricas, dimensoes, filtros, ordenar_por)
+    base = _metricas_base(metricas)
+
+    executar = _agregar_banco if modo == "banco" else _agregar_memoria
+    # ordenação por métrica derivada não vai para o motor: ordena e corta depois de derivar
+    no_motor = ordenar_por is None or ordenar_por in base
+    df = executar(base, dimensoes, periodo, filtros, incluir_nulos,
+                  ordenar_por if no_motor else None, crescente, limite if no_motor else None)
+
+    for m, (num, den) in METRICAS_DERIVADAS.items():
+        if m in metricas:
+            df[m] = (df[num] / df[den].where(df[den] > 0)).fillna(0)
+    if not no_motor:
+        df = df.sort_values(ordenar_por, ascending=crescente)
+        df = (df if limite is None else df.head(limite)).reset_index(drop=True)
+
+    # dimensões category (esquema compacto) voltam ao tipo dos valores: o resultado é pequeno
+    for d in dimensoes:
+        if isinstance(df[d].dtype, pd.CategoricalDtype):
+            df[d] = df[d].astype(df[d].cat.categories.dtype)
+    return df[dimensoes + list(metricas)]
+
+
+def limites_periodo(filtros=FILTRO_CONCLUIDAS, modo=None):
+    """Primeira e última data de venda (date, date) para os seletores de período."""
+    dias = agregar(["vendas"], ["sale_date"], filtros=filtros, modo=modo)["sale_date"]
+    return dias.min(), dias.max()
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import streamlit as st
+
+from . import agregacao
+from .carregador_dados import dados_itens_cache, dados_vendas_cache
+from .clientes import obter_estado_clientes
+from .cubo import obter_cubo
+from .dimensoes import TABELAS, tabela
+from .instrumentacao import trecho
+from .logica_IA import preparar_contexto_analise
+from .visoes import itens_concluidos, vendas_concluidas
+
+# Aquecimento na partida do app: vendas, itens e dimensões são carregados em paralelo (cada carga
+# pega a sua conexão do pool do engine) e em seguida são montados os caches derivados (visões,
+# cubo, estado de clientes, parciais do assistente). Quem pedir os dados antes do fim espera a
+# carga em andamento em vez de disparar outra. É aquecida a partição ESCOPO_PADRAO (threads fora de
+# uma sessão usam o escopo padrão); as demais carregam quando alguma sessão pedir. No modo banco
+# (MODO_AGREGACAO=banco) as páginas agregam no Postgres: só as dimensões são aquecidas, e vendas e
+# itens carregam apenas se o assistente pedir.
+AQUECIMENTO = os.getenv("AQUECIMENTO", "1").lower() in ("1", "true", "sim")
+THREADS_AQUECIMENTO = int(os.getenv("THREADS_AQUECIMENTO", "4"))
+
+
+def _derivados_vendas():
+    vendas_concluidas()
+    obter_cubo()
+    obter_estado_clientes()
+
+
+def _modo_banco():
+    return agregacao.MODO_AGREGACAO == "banco"
+
+
+class _Aquecimento:
+    """Estado de cada etapa do aquecimento: pendente, carregando, pronto ou erro (+ segundos e erro)."""
+
+    def __init__(self):
+        self.etapas = {}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _pendentes(self):
+        # chamado com self.lock
+        nomes = [] if _modo_banco() else ["vendas", "itens", "derivados_vendas", "derivados_itens", "contexto_ia"]
+        self.etapas = {nome: {"estado": "pendente", "segundos": None, "erro": None}
+                       for nome in nomes + [f"dimensao:{nome}" for nome in TABELAS]}
+
+    def _marcar(self, nome, estado, segundos=None, erro=None):
+        with self.lock:
+            self.etapas[nome] = {"estado": estado, "segundos": segundos, "erro": erro}
+
+    def _etapa(self, nome, funcao):
+        self._marcar(nome, "carregando")
+        inicio = time.perf_counter()
+        try:
+            with trecho(f"aquecimento:{nome}"):
+                funcao()
+        except Exception as erro:
+            # a página que precisar desses dados tenta de novo ao ser aberta
+            print(f"Falha no aquecimento ({nome}): {erro}")
+            self._marcar(nome, "erro", erro=str(erro))
+            return False
+        segundos = time.perf_counter() - inicio
+        self._marcar(nome, "pronto", segundos=segundos)
+        print(f"Aquecimento: {nome} pronto em {segundos:.1f} s.")
+        return True
+
+    def _cadeia(self, etapas):
+        # carga seguida dos derivados dela; para na primeira falha
+        return all(self._etapa(nome, funcao) for nome, funcao in etapas)
+
+    def aquecer(self):
+        inicio = time.perf_counter()
+        with self.lock:
+            self._pendentes()
+        with ThreadPoolExecutor(max_workers=THREADS_AQUECIMENTO, thread_name_prefix="aquecimento") as pool:
+            for nome in TABELAS:
+                pool.submit(self._etapa, f"dimensao:{nome}", partial(tabela, nome))
+            if not _modo_banco():
+                vendas = pool.submit(self._cadeia, [("vendas", dados_vendas_cache),
+                                                    ("derivados_vendas", _derivados_vendas)])
+                itens = pool.submit(self._cadeia, [("itens", dados_itens_cache),
+                                                   ("derivados_itens", itens_concluidos)])
+                if vendas.result() and itens.result():
+                    self._etapa("contexto_ia", preparar_contexto_analise)
+        print(f"Aquecimento concluído em {time.perf_counter() - inicio:.1f} s.")
+
+    def iniciar(self):
+        with self.lock:
+            if self.thread is None:
+                self._pendentes()  # a página já vê as etapas antes de a thread começar
+                self.thread = threading.Thread(target=self.aquecer, name="aquecimento", daemon=True)
+                self.thread.start()
+
+    def estado(self):
+        with self.lock:
+            return {nome: dict(etapa) for nome, etapa in self.etapas.items()}
+
+
+@st.cache_resource
+def _aquecimento():
+    return _Aquecimento()
+
+
+def iniciar_aquecimento():
+    """Dispara o aquecimento em segundo plano (uma vez por processo; nada a fazer nas chamadas seguintes)."""
+    if AQUECIMENTO:
+        _aquecimento().iniciar()
+
+
+def aquecer():
+    """Executa o aquecimento na thread atual (ex.: benchmark) e devolve o estado das etapas."""
+    _aquecimento().aquecer()
+    return estado_aquecimento()
+
+
+def estado_aquecimento():
+    """{etapa: {"estado", "segundos", "erro"}} do aquecimento do processo."""
+    return _aquecimento().estado()
+
+
+def aquecimento_pronto():
+    """True quando nenhuma etapa está pendente ou em andamento (as que falharam contam como encerradas)."""
+    return all(etapa["estado"] in ("pronto", "erro") for etapa in estado_aquecimento().values())
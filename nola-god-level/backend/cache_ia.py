@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+# Cache persistente das respostas do Gemini (SQLite local): perguntas repetidas sobre o mesmo contexto não geram nova chamada
+ARQUIVO_CACHE_IA = os.getenv("ARQUIVO_CACHE_IA", str(Path(__file__).resolve().parents[1] / ".cache_ia" / "respostas.sqlite"))
+CACHE_IA_TTL = int(os.getenv("CACHE_IA_TTL", str(24 * 3600)))           # validade de uma resposta (segundos)
+CACHE_IA_MAX_ENTRADAS = int(os.getenv("CACHE_IA_MAX_ENTRADAS", "2000"))  # acima disso, remove as menos acessadas
+
+CRIAR_TABELA = """
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    texto TEXT NOT NULL,
+    fontes TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL
+)
+"""
+
+
+def normalizar_pergunta(pergunta):
+    """Minúsculas e espaços colapsados: "Qual o  ticket médio? " e "qual o ticket médio?" viram a mesma chave."""
+    return re.sub(r"\s+", " ", str(pergunta)).strip().lower()
+
+
+def chave_resposta(pergunta, historico, contexto_json, modelo):
+    """Hash da pergunta normalizada + conversa anterior + JSON de contexto + modelo."""
+    conteudo = json.dumps({
+        "pergunta": normalizar_pergunta(pergunta),
+        "historico": [[m["role"], str(m["content"])] for m in historico],
+        "contexto": contexto_json,
+        "modelo": modelo,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _conectar():
+    if not ARQUIVO_CACHE_IA:
+        return None
+    Path(ARQUIVO_CACHE_IA).parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(ARQUIVO_CACHE_IA, timeout=5)
+    con.execute(CRIAR_TABELA)
+    return con
+
+
+def obter(chave):
+    """Devolve (texto, fontes) de uma resposta ainda válida, ou None."""
+    con = _conectar()
+    if con is None:
+        return None
+    try:
+        with con:
+            linha = con.execute("SELECT texto, fontes, criado_em FROM respostas WHERE chave = ?", (chave,)).fetchone()
+            if linha is None:
+                return None
+            if time.time() - linha[2] > CACHE_IA_TTL:
+                con.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                return None
+            con.execute("UPDATE respostas SET acessado_em = ? WHERE chave = ?", (time.time(), chave))
+    finally:
+        con.close()
+    return linha[0], json.loads(linha[1])
+
+
+def guardar(chave, texto, fontes):
+    """Grava a resposta e aplica a validade e o limite de entradas."""
+    con = _conectar()
+    if con is None:
+        return
+    agora = time.time()
+    try:
+        with con:
+            con.execute("INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?)",
+                        (chave, texto, json.dumps(fontes, ensure_ascii=False), agora, agora))
+            con.execute("DELETE FROM respostas WHERE criado_em < ?", (agora - CACHE_IA_TTL,))
+            con.execute("""
+                DELETE FROM respostas WHERE chave IN (
+                    SELECT chave FROM respostas ORDER BY acessado_em DESC LIMIT -1 OFFSET ?
+                )
+            """, (CACHE_IA_MAX_ENTRADAS,))
+    finally:
+        con.close()
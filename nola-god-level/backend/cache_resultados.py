@@ -0,0 +1,123 @@
+import functools
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+# Resultados das páginas (rankings, métricas de clientes, frames dos gráficos) guardados por
+# (versão dos dados, página, função, filtros) e compartilhados entre sessões: voltar a um período
+# ou loja já vistos não recalcula nada. LRU limitado por memória e por número de entradas.
+CACHE_RESULTADOS_MB = float(os.getenv("CACHE_RESULTADOS_MB", "128"))
+CACHE_RESULTADOS_ENTRADAS = int(os.getenv("CACHE_RESULTADOS_ENTRADAS", "1000"))
+
+
+def _normalizar(valor):
+    # filtros chegam como dict/list; a chave precisa ser hashable e não depender da ordem do dict
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _normalizar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_normalizar(v) for v in valor)
+    if isinstance(valor, (set, frozenset)):
+        return tuple(sorted(valor))
+    return valor
+
+
+def _tamanho(valor):
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamanho(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(_tamanho(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def _copia(valor):
+    # cópia rasa: com Copy-on-Write, colunas criadas/alteradas pela página não chegam ao cache
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    if isinstance(valor, dict):
+        return {k: _copia(v) for k, v in valor.items()}
+    if isinstance(valor, tuple):
+        return tuple(_copia(v) for v in valor)
+    return valor
+
+
+class _CacheResultados:
+    """LRU (chave -> (valor, bytes)) com acertos e erros por página."""
+
+    def __init__(self):
+        self.entradas = OrderedDict()
+        self.bytes = 0
+        self.acertos = {}
+        self.erros = {}
+        self.lock = threading.Lock()
+
+    def obter(self, chave, pagina):
+        with self.lock:
+            if chave in self.entradas:
+                self.entradas.move_to_end(chave)
+                self.acertos[pagina] = self.acertos.get(pagina, 0) + 1
+                return True, self.entradas[chave][0]
+            self.erros[pagina] = self.erros.get(pagina, 0) + 1
+            return False, None
+
+    def guardar(self, chave, valor):
+        tamanho = _tamanho(valor)
+        limite = CACHE_RESULTADOS_MB * 1024 ** 2
+        if tamanho > limite:
+            return
+        with self.lock:
+            if chave in self.entradas:
+                self.bytes -= self.entradas.pop(chave)[1]
+            self.entradas[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            while self.bytes > limite or len(self.entradas) > CACHE_RESULTADOS_ENTRADAS:
+                self.bytes -= self.entradas.popitem(last=False)[1][1]
+
+
+@st.cache_resource
+def _cache_resultados():
+    return _CacheResultados()
+
+
+def memoizar(pagina, versao):
+    """
+    Decorador: guarda o resultado por (versao(), pagina, função, argumentos normalizados).
+
+    `versao` é chamada a cada uso e muda quando os dados mudam, o que invalida as entradas antigas
+    (elas saem pelo LRU). Devolve sempre uma cópia rasa: trate o resultado como somente leitura.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def memoizada(*args, **kwargs):
+            try:
+                chave = (versao(), pagina, funcao.__name__, _normalizar(args), _normalizar(kwargs))
+                hash(chave)
+            except TypeError:
+                return funcao(*args, **kwargs)  # argumento sem hash (ex.: DataFrame): não guarda
+            cache = _cache_resultados()
+            encontrado, valor = cache.obter(chave, pagina)
+            if not encontrado:
+                valor = funcao(*args, **kwargs)
+                cache.guardar(chave, valor)
+            return _copia(valor)
+        return memoizada
+    return decorador
+
+
+def estatisticas():
+    """Entradas, bytes e acertos/erros por página do cache de resultados."""
+    cache = _cache_resultados()
+    with cache.lock:
+        paginas = sorted(set(cache.acertos) | set(cache.erros))
+        return {
+            "entradas": len(cache.entradas),
+            "bytes": cache.bytes,
+            "paginas": {p: (cache.acertos.get(p, 0), cache.erros.get(p, 0)) for p in paginas},
+        }
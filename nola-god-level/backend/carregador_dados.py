@@ -1,39 +1,59 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
 import pandas as pd
 from sqlalchemy import text
+from . import esquema, extracao_copy, instrumentacao, snapshot
 from .db_config import get_db_engine
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 ENGINE = get_db_engine()
+instrumentacao.instrumentar_engine(ENGINE)
+
+# Intervalo mínimo entre duas buscas incrementais (segundos). Vencido o intervalo, quem pede os dados
+# recebe o frame atual na hora e a busca roda numa thread em segundo plano (stale-while-revalidate).
+INTERVALO_INCREMENTAL = int(os.getenv("INTERVALO_INCREMENTAL", "60"))
+# De tempos em tempos refaz a carga completa para reconciliar exclusões no banco (segundos)
+INTERVALO_RECARGA_COMPLETA = int(os.getenv("INTERVALO_RECARGA_COMPLETA", str(6 * 3600)))
+# Janela revisitada a cada busca incremental para capturar mudanças de status (horas)
+JANELA_REVISAO = timedelta(hours=int(os.getenv("JANELA_REVISAO_HORAS", "24")))
+# Intervalo mínimo entre duas gravações do snapshot em disco após cargas incrementais (segundos)
+INTERVALO_SNAPSHOT = int(os.getenv("INTERVALO_SNAPSHOT", "600"))
+# Linhas por lote lidas do cursor do lado do servidor: limita o pico de memória da extração
+TAMANHO_LOTE = int(os.getenv("TAMANHO_LOTE", "100000"))
+# Partições: cada escopo (sub_brand_id, state) tem o seu frame, carregado sob demanda; None = todos.
+# ESCOPO_SUB_BRAND / ESCOPO_ESTADO definem o escopo de quem não escolheu outro (e do aquecimento).
+REDE = (None, None)
+ESCOPO_PADRAO = (int(os.environ["ESCOPO_SUB_BRAND"]) if os.getenv("ESCOPO_SUB_BRAND") else None,
+                 os.getenv("ESCOPO_ESTADO") or None)
+# Partição sem acesso há mais que isso (segundos) é descartada da memória
+PARTICAO_OCIOSA = int(os.getenv("PARTICAO_OCIOSA_SEGUNDOS", "1800"))
+# Motor de extração: "sql" (read_sql_query por cursor) ou "copy" (COPY ... TO STDOUT, ver extracao_copy.py).
+# Se o COPY falhar (driver sem suporte, permissão), a leitura é refeita pelo motor "sql".
+MOTOR_EXTRACAO = os.getenv("MOTOR_EXTRACAO", "sql")
 
+# Fato estreito: só chaves, datas, status e valores. Nomes de loja, canal, sub-marca e cliente ficam
+# nas tabelas de dimensão (dimensoes.py), com TTL próprio, e são resolvidos só nas linhas exibidas.
 DADOS_VENDAS = """
     SELECT
         s.id,
         s.store_id,
-        st.name AS store_name,
-        st.city,
-        st.state,
         s.channel_id,
-        c.name AS channel_name,
         s.created_at,
         s.sale_status_desc,
         s.total_amount,
         s.total_discount,
         s.delivery_fee,
         s.customer_id AS customer_id,
-        COALESCE(cust.customer_name, s.customer_name) AS customer_name,
-        cust.phone_number AS customer_phone,
-        st.sub_brand_id AS sub_brand_id, -- <<< ALTERAÇÃO 1: Mude de 's' para 'st'
-        sb.name AS sub_brand_name
+        CASE WHEN s.customer_id IS NULL THEN s.customer_name END AS customer_name_venda
     FROM
         sales s
-    JOIN
-        stores st ON s.store_id = st.id
-    LEFT JOIN
-        channels c ON s.channel_id = c.id
-    LEFT JOIN
-        sub_brands sb ON st.sub_brand_id = sb.id -- <<< ALTERAÇÃO 2: Mude de 's' para 'st'
-    LEFT JOIN
-        customers cust ON s.customer_id = cust.id;
 """
 
 DADOS_ITENS = """
@@ -57,17 +77,359 @@ LEFT JOIN
     sub_brands sb ON p.sub_brand_id = sb.id
 """
 
+# As duas consultas usam o alias "s" para sales, então os mesmos filtros servem para ambas:
+# vendas novas (id acima da marca d'água) + vendas recentes que podem ter mudado de status...
+FILTRO_INCREMENTAL = "(s.id > :ultimo_id OR s.created_at >= :janela_inicio)"
+# ... e vendas das lojas da partição
+FILTRO_SUB_BRAND = "s.store_id IN (SELECT id FROM stores WHERE sub_brand_id = :particao_sub_brand)"
+FILTRO_ESTADO = "s.store_id IN (SELECT id FROM stores WHERE state = :particao_estado)"
+
+
+# identifica cada cache criado no processo: uma partição descartada e recriada recomeça a versão
+_geracoes = itertools.count(1)
+
+
+def ler_lotes_sql(engine, sql, params=None):
+    """Gerador de DataFrames crus lidos por um cursor do lado do servidor, TAMANHO_LOTE linhas por vez."""
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=TAMANHO_LOTE) as con:
+        yield from pd.read_sql_query(sql=text(sql), con=con, params=params, chunksize=TAMANHO_LOTE)
+
+
+class _CacheIncremental:
+    """
+    Frame residente de uma consulta + marca d'água (id / created_at) da última carga.
+
+    Só a primeira carga do processo bloqueia quem pede os dados; depois disso as atualizações
+    (incrementais e completas) rodam numa única thread em segundo plano, e o frame novo é
+    publicado de uma vez quando fica pronto.
+    """
+
+    def __init__(self, nome, sql, col_id, col_data, tipos, monetarias, particao=REDE):
+        sub_brand, estado = particao
+        self.particao = particao
+        # sufixo dos nomes (snapshot, métricas) da partição: "@sb3", "@sb3-SP", "@rede-SP"; vazio para a rede
+        self.sufixo = "" if particao == REDE else (
+            "@" + (f"sb{sub_brand}" if sub_brand is not None else "rede") + (f"-{estado}" if estado else ""))
+        self.nome = nome + self.sufixo
+        self.sql = sql
+        self.filtros = ([FILTRO_SUB_BRAND] if sub_brand is not None else []) + ([FILTRO_ESTADO] if estado else [])
+        self.params = {"particao_sub_brand": sub_brand, "particao_estado": estado}
+        self.tipos = tipos
+        self.monetarias = monetarias
+        self.col_id = col_id      # coluna com o id da venda (chave da mesclagem)
+        self.col_data = col_data  # coluna com o created_at da venda
+        self.df = None
+        self.ultimo_id = None
+        self.ultimo_created_at = None
+        self.atualizado_em = 0.0
+        self.carga_completa_em = 0.0
+        self.snapshot_em = 0.0
+        self.esquema = snapshot.hash_esquema(self._consulta())
+        self.versao = 0
+        self.geracao = next(_geracoes)
+        # `lock` protege só a troca do frame publicado (segurado por instantes); `lock_cargas` serializa
+        # as cargas, os observadores e o registro de observadores
+        self.lock = threading.Lock()
+        self.lock_cargas = threading.Lock()
+        self.atualizando = None     # thread da atualização em segundo plano em andamento
+        self.ultimo_erro = None
+        self.falha_em = 0.0
+        self.duracao_atualizacao = None
+        # callbacks (df, removidas, novas) chamados a cada carga, antes da publicação do frame novo;
+        # removidas/novas são None na carga completa
+        self.observadores = []
+        self.derivados = {}
+
+    def _consulta(self, *filtros):
+        filtros = self.filtros + list(filtros)
+        return self.sql + ("\nWHERE\n    " + "\n    AND ".join(filtros) + "\n" if filtros else "")
+
+    def nomes_frames(self):
+        """Nomes com que este frame e os derivados dele aparecem nas métricas de memória."""
+        with self.lock:
+            derivados = list(self.derivados.values())
+        return [self.nome] + [d.nome_frame for d in derivados if hasattr(d, "nome_frame")]
+
+    def derivado(self, nome, fabrica):
+        """Objeto mantido junto com este frame (visões, cubo, estado de clientes...): um por partição."""
+        with self.lock:
+            if nome not in self.derivados:
+                self.derivados[nome] = fabrica()
+            return self.derivados[nome]
+
+    def _marcar(self):
+        if self.df.empty:
+            self.ultimo_id, self.ultimo_created_at = None, None
+        else:
+            self.ultimo_id = int(self.df[self.col_id].max())
+            self.ultimo_created_at = self.df[self.col_data].max()
+        self.atualizado_em = time.time()
+        self.versao += 1
+        instrumentacao.registrar_frame(self.nome, self.df)
+
+    def _salvar_snapshot(self, forcar=False):
+        if not forcar and time.time() - self.snapshot_em < INTERVALO_SNAPSHOT:
+            return
+        snapshot.salvar(self.nome, self.df, self.esquema, ultimo_id=self.ultimo_id,
+                        ultimo_created_at=self.ultimo_created_at, carga_completa_em=self.carga_completa_em)
+        self.snapshot_em = time.time()
+
+    def carregar_snapshot(self):
+        """Parte do snapshot em disco; a busca incremental seguinte completa o que mudou desde então."""
+        df, meta = snapshot.carregar(self.nome, self.esquema)
+        if df is None:
+            return
+        self._publicar(df, None, None)
+        if meta["ultimo_id"] is not None:
+            self.ultimo_id = int(meta["ultimo_id"])
+            self.ultimo_created_at = pd.Timestamp(meta["ultimo_created_at"])
+        self.snapshot_em = meta["salvo_em"]
+        self.carga_completa_em = meta["carga_completa_em"]
+        self.atualizado_em = 0.0  # força a busca incremental logo em seguida
+
+    def _ler(self, sql, params=None):
+        """
+        Lê a consulta em lotes (cursor do lado do servidor ou COPY, conforme MOTOR_EXTRACAO).
+
+        Cada lote é convertido para o esquema compacto assim que chega, então o driver nunca
+        bufferiza o resultado inteiro e só existe um lote "cru" em memória por vez.
+        Devolve (df, MB que o resultado ocuparia sem o esquema compacto).
+        """
+        with instrumentacao.trecho(f"extracao:{self.nome}"):
+            if MOTOR_EXTRACAO == "copy":
+                try:
+                    return self._consumir(extracao_copy.ler_lotes_copy(
+                        ENGINE, sql, params, tipos=self._tipos_copy(), colunas_data=[self.col_data]))
+                except Exception as erro:
+                    print(f"COPY falhou para {self.nome} ({erro}); lendo com read_sql_query.")
+            return self._consumir(ler_lotes_sql(ENGINE, sql, params))
+
+    def _tipos_copy(self):
+        # tipos fixos para o parser do CSV: sem isso ele infere pelo primeiro bloco (ex.: telefone vira número)
+        tipos = {col: "float64" for col in self.monetarias}
+        for col, tipo in self.tipos.items():
+            tipos[col] = {"category": "string", "Int64": "int64", "Int32": "int64"}.get(tipo, "float64")
+        return tipos
+
+    def _consumir(self, lotes_brutos):
+        lotes, mb_bruto = [], 0.0
+        for bruto in lotes_brutos:
+            mb_bruto += esquema.memoria_mb(bruto)
+            lotes.append(esquema.aplicar_esquema(bruto, self.tipos, self.monetarias, self.col_data))
+        df = lotes[0] if len(lotes) == 1 else esquema.concatenar(lotes)
+        return self._ordenar(df), mb_bruto
+
+    def _ordenar(self, df):
+        # frames sempre ordenados pela data da venda: recortes por período viram busca binária (visoes.fatiar_periodo)
+        if df[self.col_data].is_monotonic_increasing:
+            return df
+        return df.sort_values(self.col_data, kind="stable", ignore_index=True)
+
+    def _publicar(self, df, removidas, novas, completa=False):
+        """Atualiza os observadores com o frame novo e só então o publica (troca atômica sob `lock`)."""
+        for observador in self.observadores:
+            observador(df, removidas, novas)
+        with self.lock:
+            self.df = df
+            if completa:
+                self.carga_completa_em = time.time()
+            self._marcar()
+
+    def carga_completa(self):
+        df, antes = self._ler(self._consulta(), self.params)
+        print(f"Dados carregados: {len(df)} linhas de {self.nome} "
+              f"(memória {antes:.1f} MB -> {esquema.memoria_mb(df):.1f} MB).")
+        self._publicar(df, None, None, completa=True)
+        self._salvar_snapshot(forcar=True)
+
+    def carga_incremental(self):
+        if self.ultimo_id is None:
+            return self.carga_completa()
+
+        params = {
+            **self.params,
+            "ultimo_id": self.ultimo_id,
+            "janela_inicio": (pd.Timestamp(self.ultimo_created_at) - JANELA_REVISAO).to_pydatetime(),
+        }
+        delta, _ = self._ler(self._consulta(FILTRO_INCREMENTAL), params)
+        if delta.empty:
+            self.atualizado_em = time.time()
+            return
+
+        # substitui as vendas re-buscadas (status pode ter mudado) e acrescenta as novas
+        atual = self.df
+        substituir = atual[self.col_id].isin(delta[self.col_id].unique())
+        removidas = atual[substituir]
+        # o delta cobre a janela mais recente, então a concatenação normalmente já sai ordenada
+        df = self._ordenar(esquema.concatenar([atual[~substituir], delta]))
+        print(f"Dados incrementais: {len(delta)} linhas de {self.nome} (total {len(df)}).")
+        self._publicar(df, removidas, delta)
+        self._salvar_snapshot()
+
+    def _vencido(self):
+        agora = time.time()
+        if agora - self.falha_em < INTERVALO_INCREMENTAL:
+            return False  # espera um intervalo antes de tentar de novo
+        return (agora - self.carga_completa_em >= INTERVALO_RECARGA_COMPLETA
+                or agora - self.atualizado_em >= INTERVALO_INCREMENTAL)
+
+    def _atualizar_em_segundo_plano(self):
+        inicio = time.time()
+        try:
+            with self.lock_cargas:
+                if time.time() - self.carga_completa_em >= INTERVALO_RECARGA_COMPLETA:
+                    self.carga_completa()
+                else:
+                    self.carga_incremental()
+            self.ultimo_erro = None
+        except Exception as erro:
+            # continua servindo o frame anterior
+            print(f"Falha ao atualizar {self.nome} em segundo plano: {erro}")
+            self.ultimo_erro = str(erro)
+            self.falha_em = time.time()
+        finally:
+            self.duracao_atualizacao = time.time() - inicio
+            with self.lock:
+                self.atualizando = None
 
-@st.cache_data(ttl=600)
+    def obter(self):
+        with self.lock:
+            df = self.df
+            if df is not None:
+                if self.atualizando is None and self._vencido():
+                    self.atualizando = threading.Thread(
+                        target=self._atualizar_em_segundo_plano, name=f"atualizacao-{self.nome}", daemon=True)
+                    self.atualizando.start()
+                return df
+        # primeira carga do processo: não há o que servir, então espera (uma carga só para todos)
+        with self.lock_cargas:
+            if self.df is None:
+                self.carregar_snapshot()
+            if self.df is None:
+                self.carga_completa()
+        return self.obter()
+
+    def registrar_observador(self, callback):
+        """Alinha `callback` ao frame atual e passa a chamá-lo a cada carga (idempotente)."""
+        # já registrado (o caso de toda chamada depois da primeira): não espera a atualização em andamento
+        with self.lock:
+            if callback in self.observadores:
+                return
+        with self.lock_cargas:
+            if callback not in self.observadores:
+                callback(self.df, None, None)
+                with self.lock:
+                    self.observadores.append(callback)
+
+    def estado(self):
+        """Idade dos dados publicados e situação da atualização em segundo plano."""
+        return {
+            "nome": self.nome,
+            "linhas": None if self.df is None else len(self.df),
+            # recém-restaurado do snapshot, a idade conta a partir de quando ele foi salvo
+            "idade_segundos": None if self.df is None else time.time() - max(self.atualizado_em, self.snapshot_em),
+            "atualizando": self.atualizando is not None,
+            "ultimo_erro": self.ultimo_erro,
+            "duracao_atualizacao": self.duracao_atualizacao,
+        }
+
+
+CONSULTAS = {
+    "vendas": dict(sql=DADOS_VENDAS, col_id="id", col_data="created_at",
+                   tipos=esquema.ESQUEMA_VENDAS, monetarias=esquema.MONETARIAS_VENDAS),
+    "itens": dict(sql=DADOS_ITENS, col_id="sale_id", col_data="sale_date",
+                  tipos=esquema.ESQUEMA_ITENS, monetarias=esquema.MONETARIAS_ITENS),
+}
+
+
+def _maiores(particao):
+    # partições que contêm `particao`, da menor para a maior (sem o estado, depois a rede inteira)
+    return [p for p in dict.fromkeys([(particao[0], None), REDE]) if p != particao]
+
+
+class _Particoes:
+    """Caches incrementais por (consulta, partição), criados sob demanda e descartados quando ociosos."""
+
+    def __init__(self):
+        self.caches = {}
+        self.uso = {}
+        self.lock = threading.Lock()
+
+    def obter(self, nome, particao, reaproveitar=False):
+        agora = time.time()
+        with self.lock:
+            chave = (nome, particao)
+            if chave not in self.caches and reaproveitar:
+                # uma partição maior já residente serve (quem consulta filtra pelo escopo)
+                chave = next(((nome, p) for p in _maiores(particao) if (nome, p) in self.caches), chave)
+            if chave not in self.caches:
+                self.caches[chave] = _CacheIncremental(nome, particao=particao, **CONSULTAS[nome])
+            self.uso[chave] = agora
+            cache = self.caches[chave]
+            for ociosa in [c for c, uso in self.uso.items() if agora - uso > PARTICAO_OCIOSA]:
+                print(f"Partição ociosa descartada: {self.caches[ociosa].nome}.")
+                instrumentacao.esquecer_frames(self.caches[ociosa].nomes_frames())
+                del self.caches[ociosa], self.uso[ociosa]
+            return cache
+
+    def residentes(self):
+        with self.lock:
+            return list(self.caches.values())
+
+
+@st.cache_resource
+def _particoes():
+    return _Particoes()
+
+
+# escopo definido por código (escopo_dados); sem ele vale o da sessão e, fora de uma sessão, ESCOPO_PADRAO
+_escopo = contextvars.ContextVar("escopo_dados", default=None)
+
+
+@contextmanager
+def escopo_dados(particao, reaproveitar=False):
+    """
+    Dentro do bloco, os dados (e tudo o que deriva deles) vêm da partição (sub_brand_id, state).
+    Com `reaproveitar`, uma partição maior já em memória é usada no lugar (o chamador filtra).
+    """
+    token = _escopo.set((tuple(particao), reaproveitar))
+    try:
+        yield
+    finally:
+        _escopo.reset(token)
+
+
+def _escopo_atual():
+    escopo = _escopo.get()
+    if escopo is not None:
+        return escopo
+    if get_script_run_ctx(suppress_warning=True) is not None and "particao_dados" in st.session_state:
+        return tuple(st.session_state.particao_dados), False
+    return ESCOPO_PADRAO, False
+
+
+def particao_atual():
+    """Partição (sub_brand_id, state) pedida pela execução corrente."""
+    return _escopo_atual()[0]
+
+
+def _cache_vendas():
+    return _particoes().obter("vendas", *_escopo_atual())
+
+
+def _cache_itens():
+    return _particoes().obter("itens", *_escopo_atual())
+
+
+# Os frames retornados são compartilhados entre sessões: trate como somente leitura.
 def dados_vendas_cache():
-    df = pd.read_sql_query(sql=text(DADOS_VENDAS), con=ENGINE)
-    print(f"Dados carregados: {len(df)} linhas de vendas.")
-    return df
+    return _cache_vendas().obter()
 
 
-@st.cache_data(ttl=600)
 def dados_itens_cache():
-    df = pd.read_sql_query(sql=text(DADOS_ITENS), con=ENGINE)
-    print(f"Dados carregados: {len(df)} linhas de itens.")
-    return df
+    return _cache_itens().obter()
+
 
+def estado_dados():
+    """Estado (idade, atualização em andamento, último erro) das partições já carregadas, para a interface."""
+    return [cache.estado() for cache in _particoes().residentes() if cache.df is not None]
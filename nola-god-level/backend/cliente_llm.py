@@ -0,0 +1,125 @@
+import json
+import os
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .instrumentacao import registrar_tempo, trecho
+
+# Cliente HTTP do Gemini: sessão com pool de conexões, timeouts, novas tentativas e streaming
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-preview-09-2025")
+# base configurável para apontar para um servidor stub local nos testes
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+TIMEOUT_CONEXAO = float(os.getenv("LLM_TIMEOUT_CONEXAO", "5"))   # segundos para abrir a conexão
+TIMEOUT_LEITURA = float(os.getenv("LLM_TIMEOUT_LEITURA", "60"))  # segundos sem receber nenhum byte
+TENTATIVAS = int(os.getenv("LLM_TENTATIVAS", "3"))              # novas tentativas em 429/5xx e falha de conexão
+STATUS_REPETIR = (429, 500, 502, 503, 504)
+
+
+class ErroLLM(Exception):
+    """Falha ao obter resposta do Gemini (timeout, HTTP de erro ou resposta sem texto)."""
+
+
+@st.cache_resource
+def _sessao():
+    repetir = Retry(
+        total=TENTATIVAS,
+        backoff_factor=1.0,  # espera exponencial entre as tentativas
+        status_forcelist=STATUS_REPETIR,
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    sessao = requests.Session()
+    sessao.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=repetir))
+    sessao.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=repetir))
+    return sessao
+
+
+def _post(metodo, payload, api_key, stream=False, modelo=None):
+    if metodo == "cachedContents":
+        url = f"{GEMINI_API_BASE}/cachedContents"
+    else:
+        url = f"{GEMINI_API_BASE}/models/{modelo or GEMINI_MODEL}:{metodo}"
+    corpo = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    print(f"Gemini {metodo}: {len(corpo)} bytes enviados ({len(payload.get('contents', []))} mensagens{', contexto em cache' if 'cachedContent' in payload else ''}).")
+    # com stream, mede até a chegada dos cabeçalhos; a leitura do texto é medida em RespostaStream
+    with trecho(f"gemini:{metodo}"):
+        try:
+            resposta = _sessao().post(
+                url,
+                params={"alt": "sse"} if stream else None,
+                headers={"Content-Type": "application/json; charset=utf-8", "x-goog-api-key": api_key},
+                data=corpo,
+                timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA),
+                stream=stream,
+            )
+            resposta.raise_for_status()
+        except requests.RequestException as erro:
+            raise ErroLLM(f"Falha na chamada ao Gemini: {erro}") from erro
+    return resposta
+
+
+def _fontes(candidato):
+    return candidato.get("groundingMetadata", {}).get("groundingAttributions", [])
+
+
+def gerar(payload, api_key, modelo=None):
+    """generateContent: devolve (texto, fontes) com a resposta completa."""
+    resultado = _post("generateContent", payload, api_key, modelo=modelo).json()
+    try:
+        candidato = resultado["candidates"][0]
+        return candidato["content"]["parts"][0]["text"], _fontes(candidato)
+    except (KeyError, IndexError) as erro:
+        raise ErroLLM(f"Resposta do Gemini sem texto: {resultado}") from erro
+
+
+def criar_cache(conteudo, api_key, modelo=None):
+    """cachedContents: guarda instrução/ferramentas no Gemini e devolve o nome para `cachedContent`."""
+    payload = {"model": f"models/{modelo or GEMINI_MODEL}", **conteudo}
+    resultado = _post("cachedContents", payload, api_key).json()
+    if "name" not in resultado:
+        raise ErroLLM(f"Cache de contexto não criado: {resultado}")
+    return resultado["name"]
+
+
+class RespostaStream:
+    """
+    Iterável com os trechos de texto de streamGenerateContent, na ordem em que chegam (para st.write_stream).
+
+    Depois de consumido, `texto` tem a resposta inteira e `fontes` as referências da busca.
+    """
+
+    def __init__(self, resposta):
+        self.resposta = resposta
+        self.texto = ""
+        self.fontes = []
+
+    def __iter__(self):
+        self.resposta.encoding = "utf-8"  # text/event-stream sem charset cairia no ISO-8859-1 padrão do requests
+        inicio = time.perf_counter()
+        try:
+            with self.resposta:
+                for linha in self.resposta.iter_lines(decode_unicode=True):
+                    if not linha or not linha.startswith("data:"):
+                        continue
+                    candidato = (json.loads(linha[len("data:"):]).get("candidates") or [{}])[0]
+                    self.fontes = _fontes(candidato) or self.fontes
+                    for parte in candidato.get("content", {}).get("parts", []):
+                        if parte.get("text"):
+                            if not self.texto:
+                                registrar_tempo("gemini:primeiro_trecho", time.perf_counter() - inicio)
+                            self.texto += parte["text"]
+                            yield parte["text"]
+        except requests.RequestException as erro:
+            raise ErroLLM(f"Conexão com o Gemini interrompida: {erro}") from erro
+        finally:
+            registrar_tempo("gemini:stream", time.perf_counter() - inicio)
+
+
+def gerar_stream(payload, api_key, modelo=None):
+    """streamGenerateContent (SSE): devolve um RespostaStream para renderizar o texto aos poucos."""
+    return RespostaStream(_post("streamGenerateContent", payload, api_key, stream=True, modelo=modelo))
@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from . import agregacao
+from .cache_resultados import memoizar
+from .carregador_dados import _cache_vendas
+from .esquema import centavos
+from .instrumentacao import registrar_frame, trecho
+
+SEM_COMPRA = -1  # dia devolvido para cliente nulo ou sem venda concluída
+
+
+def _estado(df):
+    """Primeira/última compra (dia ordinal), pedidos e gasto total (centavos) por cliente, só vendas COMPLETED."""
+    concluidas = df[(df["sale_status_desc"] == "COMPLETED") & df["customer_id"].notna()]
+    estado = concluidas.groupby("customer_id").agg(
+        primeira_compra=("dia", "min"),
+        ultima_compra=("dia", "max"),
+        pedidos=("id", "size"),
+        gasto_centavos=(centavos("total_amount"), "sum"),
+    )
+    return estado.astype({"primeira_compra": "int32", "ultima_compra": "int32", "pedidos": "int32", "gasto_centavos": "int64"})
+
+
+class _EstadoClientes:
+    """Tabela de estado por cliente mantida junto com o frame de vendas (observador do carregador)."""
+
+    def __init__(self, nome="estado_clientes"):
+        self.nome_frame = nome
+        self.tabela = None
+        self.base = None  # frame de vendas que a tabela reflete
+        self.lock = threading.Lock()
+
+    def atualizar(self, df, removidas, novas):
+        # chamado antes da publicação de `df`: a tabela fica à frente do frame publicado por instantes
+        with trecho("clientes:estado"):
+            tabela = self._atualizar(df, removidas, novas)
+        with self.lock:
+            self.tabela, self.base = tabela, df
+        registrar_frame(self.nome_frame, tabela)
+
+    def _atualizar(self, df, removidas, novas):
+        if removidas is None:
+            return _estado(df)
+
+        # só os clientes tocados pelo delta são recalculados, a partir das linhas atuais deles
+        afetados = pd.concat([removidas["customer_id"], novas["customer_id"]]).dropna().unique()
+        if len(afetados) == 0:
+            return self.tabela
+        recalculados = _estado(df[df["customer_id"].isin(afetados)])
+        restantes = self.tabela[~self.tabela.index.isin(afetados)]
+        return pd.concat([restantes, recalculados]).sort_index()
+
+    def atual(self):
+        """(frame de vendas refletido, tabela), lidos juntos."""
+        with self.lock:
+            return self.base, self.tabela
+
+
+@memoizar("clientes", agregacao.versao_dados)
+def _estado_banco():
+    """_estado() calculado no banco com um GROUP BY customer_id (modo banco: sem frame de vendas residente)."""
+    estado = agregacao.agregar(["primeiro_dia", "ultimo_dia", "vendas", "faturamento"], ["customer_id"],
+                               filtros=agregacao.FILTRO_CONCLUIDAS)
+    estado = estado.set_index("customer_id").rename(columns={
+        "primeiro_dia": "primeira_compra", "ultimo_dia": "ultima_compra", "vendas": "pedidos"})
+    estado["gasto_centavos"] = np.rint(estado.pop("faturamento") * 100)
+    estado.index = estado.index.astype("Int32")
+    return estado.sort_index().astype(
+        {"primeira_compra": "int32", "ultima_compra": "int32", "pedidos": "int32", "gasto_centavos": "int64"})
+
+
+def _estado_clientes(cache):
+    # um estado por partição, guardado junto com o cache dela
+    return cache.derivado("estado_clientes", lambda: _EstadoClientes("estado_clientes" + cache.sufixo))
+
+
+def obter_estado_clientes():
+    """
+    Tabela indexada por customer_id com primeira_compra, ultima_compra (dias desde 1970-01-01),
+    pedidos e gasto_centavos, sobre as vendas concluídas da partição corrente. Compartilhada entre
+    sessões: somente leitura. No modo banco vem de uma agregação no banco (guardada por versão dos dados).
+    """
+    if agregacao.MODO_AGREGACAO == "banco":
+        return _estado_banco()
+    cache = _cache_vendas()
+    cache.obter()
+    estado = _estado_clientes(cache)
+    cache.registrar_observador(estado.atualizar)
+    return estado.tabela
+
+
+def primeira_compra(clientes):
+    """Dia (ordinal) da primeira compra global de cada customer_id de `clientes`; SEM_COMPRA quando não há."""
+    tabela = obter_estado_clientes()
+    posicoes = tabela.index.get_indexer(clientes)
+    return np.where(posicoes >= 0, tabela["primeira_compra"].to_numpy()[posicoes], SEM_COMPRA)
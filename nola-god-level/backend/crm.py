@@ -0,0 +1,152 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import agregacao
+from .cache_resultados import memoizar
+from .carregador_dados import _cache_vendas
+from .clientes import _estado_clientes, obter_estado_clientes
+from .esquema import reais, serie_dia_ordinal
+from .instrumentacao import cronometrar
+from .visoes import vendas_concluidas
+
+# Segmentos RFM (avaliados em ordem): nome -> condição sobre as notas R e FM (média de F e M)
+SEGMENTOS_RFM = {
+    "Campeões": lambda r, fm: (r >= 4) & (fm >= 4),
+    "Em Risco": lambda r, fm: (r <= 2) & (fm >= 3),
+    "Novos": lambda r, fm: (r >= 4) & (fm <= 2),
+    "Leais": lambda r, fm: (r >= 3) & (fm >= 3),
+    "Hibernando": lambda r, fm: (r <= 2) & (fm <= 2),
+}
+SEGMENTO_PADRAO = "Precisam de Atenção"
+
+
+def _nota(valores, invertida=False):
+    """Nota 1-5 pelo percentil (empates recebem a mesma nota); invertida = menor valor, maior nota."""
+    nota = np.ceil(valores.rank(pct=True) * 5).clip(1, 5).astype("int8")
+    return 6 - nota if invertida else nota
+
+
+def _mes(dias):
+    """Dias desde 1970-01-01 -> meses desde 1970-01."""
+    return np.asarray(dias, dtype="int64").astype("datetime64[D]").astype("datetime64[M]").astype("int64")
+
+
+def _rotulo_mes(meses):
+    return pd.Index(np.asarray(meses, dtype="int64").astype("datetime64[M]").astype(str))
+
+
+@cronometrar("crm:rfm")
+def calcular_rfm(estado):
+    """
+    Recência, frequência, valor e notas RFM de todos os clientes, a partir da tabela de estado.
+
+    A recência é contada a partir do último dia com venda na base (os dados podem ser históricos).
+    """
+    if estado.empty:
+        return pd.DataFrame(columns=["recencia_dias", "frequencia", "valor", "R", "F", "M", "RFM", "segmento"])
+    rfm = pd.DataFrame({
+        "recencia_dias": estado["ultima_compra"].max() - estado["ultima_compra"],
+        "frequencia": estado["pedidos"],
+        "valor": reais(estado["gasto_centavos"]),
+    })
+    rfm["R"] = _nota(rfm["recencia_dias"], invertida=True)
+    rfm["F"] = _nota(rfm["frequencia"])
+    rfm["M"] = _nota(rfm["valor"])
+    rfm["RFM"] = (rfm["R"].astype("int16") * 100 + rfm["F"] * 10 + rfm["M"]).astype("int16")  # ex.: 545
+
+    r, fm = rfm["R"].to_numpy(), np.rint((rfm["F"].to_numpy() + rfm["M"].to_numpy()) / 2)
+    rfm["segmento"] = np.select([cond(r, fm) for cond in SEGMENTOS_RFM.values()], list(SEGMENTOS_RFM), default=SEGMENTO_PADRAO)
+    return rfm
+
+
+@cronometrar("crm:coortes")
+def calcular_coortes(vendas, estado):
+    """
+    Matriz de retenção por coorte mensal de aquisição.
+
+    Linhas: mês da primeira compra ("AAAA-MM"); colunas: meses desde a aquisição (0, 1, 2...);
+    valores: fração dos clientes da coorte que compraram naquele mês.
+    """
+    identificadas = vendas[vendas["customer_id"].notna()]
+    ativos = pd.DataFrame({
+        "customer_id": identificadas["customer_id"].to_numpy(dtype="int64"),
+        "mes": _mes(identificadas["dia"]),
+    }).drop_duplicates()
+
+    primeira = estado["primeira_compra"].to_numpy()[estado.index.get_indexer(ativos["customer_id"])]
+    ativos["coorte"] = _mes(primeira)
+    ativos["meses_desde_aquisicao"] = ativos["mes"] - ativos["coorte"]
+
+    clientes = ativos.groupby(["coorte", "meses_desde_aquisicao"]).size().unstack(fill_value=0)
+    if clientes.empty:
+        return clientes.astype("float64")
+    retencao = clientes.div(clientes[0], axis=0)
+    retencao.index = _rotulo_mes(retencao.index)
+    retencao.index.name = "coorte"
+    return retencao
+
+
+class _AnaliseCRM:
+    """RFM e coortes calculados uma vez por versão dos dados de vendas."""
+
+    def __init__(self):
+        self.versao = None
+        self.rfm = None
+        self.coortes = None
+        self.lock = threading.Lock()
+
+    def _entradas(self):
+        # vendas, estado dos clientes e versão do mesmo frame publicado: o estado é atualizado antes da
+        # publicação de cada carga, então se uma publicação cair no meio das leituras, lê de novo
+        cache = _cache_vendas()
+        cache.obter()
+        while True:
+            with cache.lock:
+                df, versao = cache.df, cache.versao
+            vendas = vendas_concluidas()
+            obter_estado_clientes()
+            base, estado = _estado_clientes(cache).atual()
+            with cache.lock:
+                if cache.versao == versao and base is df:
+                    return vendas, estado, versao
+            time.sleep(0.01)  # publicação em andamento
+
+    def obter(self):
+        vendas, estado, versao = self._entradas()
+        with self.lock:
+            if self.versao != versao:
+                self.rfm = calcular_rfm(estado)
+                self.coortes = calcular_coortes(vendas, estado)
+                self.versao = versao
+            return self.rfm, self.coortes
+
+
+@memoizar("crm", agregacao.versao_dados)
+def _analise_banco():
+    # modo banco: estado dos clientes e pares (cliente, mês) ativos vêm de GROUP BYs no banco
+    estado = obter_estado_clientes()
+    ativos = agregacao.agregar(["vendas"], ["customer_id", "mes"], filtros=agregacao.FILTRO_CONCLUIDAS)
+    vendas = pd.DataFrame({"customer_id": ativos["customer_id"], "dia": serie_dia_ordinal(pd.to_datetime(ativos["mes"]))})
+    return calcular_rfm(estado), calcular_coortes(vendas, estado)
+
+
+def _analise_crm():
+    # uma análise por partição de dados
+    return _cache_vendas().derivado("analise_crm", _AnaliseCRM)
+
+
+def analise_rfm():
+    """Frame indexado por customer_id com recência, frequência, valor, notas R/F/M e segmento."""
+    if agregacao.MODO_AGREGACAO == "banco":
+        return _analise_banco()[0]
+    return _analise_crm().obter()[0]
+
+
+def matriz_coortes():
+    """Matriz de retenção (coorte mensal x meses desde a aquisição)."""
+    if agregacao.MODO_AGREGACAO == "banco":
+        return _analise_banco()[1]
+    return _analise_crm().obter()[1]
@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .carregador_dados import _cache_vendas
+from .dimensoes import ROTULOS as TABELA_DO_ROTULO, TABELAS, rotulo
+from .esquema import centavos, data_do_ordinal, dia_da_semana, mes_do_ordinal, reais, semana_do_ordinal
+from .instrumentacao import registrar_frame, trecho
+from .metricas import TabelaFatorada
+from .visoes import fatiar_periodo
+
+# Chaves das células do cubo e medidas somáveis guardadas em cada uma (dinheiro em centavos)
+CHAVES_CUBO = ["dia", "hora", "store_id", "channel_id", "sale_status_desc"]
+MEDIDAS_CUBO = {
+    "faturamento": centavos("total_amount"),
+    "desconto": centavos("total_discount"),
+    "taxa_entrega": centavos("delivery_fee"),
+}
+
+# Rótulos resolvidos pelas tabelas de dimensão só depois de agregar (todos determinados por loja ou canal)
+ROTULOS = [r for r, tabela in TABELA_DO_ROTULO.items() if tabela in ("lojas", "canais")]
+# Dimensões derivadas do dia
+DERIVADAS_DIA = {
+    "sale_date": data_do_ordinal,
+    "dia_semana": dia_da_semana,
+    "semana": semana_do_ordinal,
+    "mes": mes_do_ordinal,
+}
+# Tabelas fatoradas (período + filtros) guardadas por versão do cubo: as várias agregações de uma
+# página sobre o mesmo recorte reaproveitam a fatia, os filtros e os códigos das chaves
+MAX_TABELAS = 16
+
+
+def _celulas(df):
+    """Agrega linhas de vendas nas células do cubo."""
+    chaves = [df["dia"], df["created_at"].dt.hour.astype("int8").rename("hora")] + [df[c] for c in CHAVES_CUBO[2:]]
+    medidas = {m: (col, "sum") for m, col in MEDIDAS_CUBO.items()}
+    medidas["vendas"] = ("id", "size")
+    return df.groupby(chaves, dropna=False, observed=True).agg(**medidas).reset_index()
+
+
+class _CuboVendas:
+    """Rollup (dia, hora, loja, canal, status) mantido junto com o frame de vendas."""
+
+    def __init__(self, nome="cubo"):
+        self.nome_frame = nome
+        self.celulas = None
+        self.versao = 0
+        self.tabelas = OrderedDict()
+        self.lock = threading.Lock()
+
+    def atualizar(self, df, removidas, novas):
+        # chamado também pela atualização em segundo plano: as células novas são montadas à parte
+        # e trocadas de uma vez, junto com a versão que invalida as tabelas guardadas
+        with trecho("cubo:atualizar"):
+            celulas = self._atualizar(df, removidas, novas)
+        with self.lock:
+            self.celulas = celulas
+            self.versao += 1
+            self.tabelas.clear()
+        registrar_frame(self.nome_frame, celulas)
+
+    def _atualizar(self, df, removidas, novas):
+        if removidas is None:
+            return _celulas(df)
+
+        # soma as vendas novas e subtrai a contribuição antiga das que foram re-buscadas
+        partes = [self.celulas, _celulas(novas)]
+        if not removidas.empty:
+            antigas = _celulas(removidas)
+            antigas[list(MEDIDAS_CUBO) + ["vendas"]] *= -1
+            partes.append(antigas)
+        celulas = pd.concat(partes, ignore_index=True)
+        celulas = celulas.groupby(CHAVES_CUBO, dropna=False, observed=True).sum().reset_index()
+        return celulas[celulas["vendas"] != 0].reset_index(drop=True)
+
+    def tabela(self, periodo, filtros):
+        """Células do período que passam nos filtros, fatoradas (LRU por recorte)."""
+        chave = (periodo, tuple(sorted((d, tuple(v) if isinstance(v, (list, tuple, set)) else v)
+                                       for d, v in filtros.items())))
+        with self.lock:
+            if chave in self.tabelas:
+                self.tabelas.move_to_end(chave)
+                return self.tabelas[chave]
+            celulas, versao = self.celulas, self.versao
+
+        # as células saem do groupby ordenadas pela primeira chave (dia)
+        if periodo is not None:
+            celulas = fatiar_periodo(celulas, *periodo)
+        tabela = TabelaFatorada(celulas)
+        if filtros:
+            mascara = np.ones(len(tabela), dtype=bool)
+            for d, valor in filtros.items():
+                mascara &= tabela.mascara(registrar_chave(tabela, d), valor)
+            tabela = tabela.filtrar(mascara)
+
+        with self.lock:
+            # células trocadas no meio do caminho: devolve a tabela, mas não a guarda
+            if versao == self.versao:
+                self.tabelas[chave] = tabela
+                if len(self.tabelas) > MAX_TABELAS:
+                    self.tabelas.popitem(last=False)
+        return tabela
+
+
+def obter_cubo():
+    """Cubo atualizado com a última carga (incremental) das vendas da partição corrente."""
+    cache = _cache_vendas()
+    cache.obter()
+    cubo = cache.derivado("cubo", lambda: _CuboVendas("cubo" + cache.sufixo))
+    cache.registrar_observador(cubo.atualizar)
+    return cubo
+
+
+def cobre(metricas, dimensoes, filtros):
+    """Indica se a agregação pode ser respondida só com o cubo."""
+    dimensoes_cubo = set(CHAVES_CUBO) | set(ROTULOS) | set(DERIVADAS_DIA)
+    return (all(m in MEDIDAS_CUBO or m == "vendas" for m in metricas)
+            and all(d in dimensoes_cubo for d in list(dimensoes) + list(filtros)))
+
+
+def registrar_chave(tabela, nome):
+    """
+    Registra em `tabela` as dimensões determinadas por outra coluna: derivadas do dia e rótulos
+    de loja/canal, resolvidos só nos valores distintos da chave. Devolve o nome da dimensão.
+    """
+    if nome in DERIVADAS_DIA:
+        tabela.derivar(nome, "dia", DERIVADAS_DIA[nome])
+    elif nome in ROTULOS:
+        base = TABELAS[TABELA_DO_ROTULO[nome]][1]
+        tabela.derivar(nome, base, lambda valores: rotulo(pd.DataFrame({base: valores}), nome))
+    return nome
+
+
+def agregar_cubo(metricas, dimensoes, periodo, filtros, incluir_nulos):
+    """Mesmo contrato de agregacao._agregar_memoria, respondido a partir das células do cubo."""
+    tabela = obter_cubo().tabela(periodo, filtros)
+    chaves = [registrar_chave(tabela, d) for d in dimensoes]
+    resultado = tabela.agregar({m: m for m in metricas}, chaves, dropna=not incluir_nulos)
+    for m in metricas:
+        if m in MEDIDAS_CUBO:
+            resultado[m] = reais(resultado[m])
+    return resultado
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import bindparam, text
+
+from .carregador_dados import ENGINE, INTERVALO_INCREMENTAL
+
+# As tabelas de dimensão mudam pouco: recarregadas com TTL próprio, bem maior que o das vendas (segundos).
+# Vencido o TTL, quem pede a tabela recebe a atual na hora e a recarga roda em segundo plano.
+INTERVALO_DIMENSOES = int(os.getenv("INTERVALO_DIMENSOES", "3600"))
+
+# nome -> (consulta, chave no frame de vendas)
+TABELAS = {
+    "lojas": ("""
+        SELECT
+            st.id AS store_id,
+            st.name AS store_name,
+            st.city,
+            st.state,
+            st.sub_brand_id,
+            sb.name AS sub_brand_name
+        FROM stores st
+        LEFT JOIN sub_brands sb ON st.sub_brand_id = sb.id
+    """, "store_id"),
+    "canais": ("""
+        SELECT id AS channel_id, name AS channel_name FROM channels
+    """, "channel_id"),
+}
+# Dimensões grandes (uma linha por cliente) nunca ficam inteiras em memória: a cada rotulagem são
+# buscadas só as linhas das chaves exibidas (ex.: o top 10), com WHERE id IN :ids
+SOB_DEMANDA = {
+    "clientes": ("""
+        SELECT id AS customer_id, customer_name, phone_number AS customer_phone FROM customers
+        WHERE id IN :ids
+    """, "customer_id"),
+}
+
+# rótulo -> tabela de dimensão que o resolve
+ROTULOS = {
+    "store_name": "lojas",
+    "city": "lojas",
+    "state": "lojas",
+    "sub_brand_id": "lojas",
+    "sub_brand_name": "lojas",
+    "channel_name": "canais",
+    "customer_name": "clientes",
+    "customer_phone": "clientes",
+}
+# rótulo -> coluna do próprio frame de vendas usada quando a dimensão não tem o valor
+RESERVAS = {
+    "customer_name": "customer_name_venda",
+}
+
+
+class _CacheDimensao:
+    """Tabela de dimensão pequena, indexada pela chave, recarregada a cada INTERVALO_DIMENSOES."""
+
+    def __init__(self, nome, sql, chave):
+        self.nome = nome
+        self.sql = sql
+        self.chave = chave
+        self.df = None
+        self.carregado_em = 0.0
+        self.falha_em = 0.0
+        # `lock` protege a troca da tabela publicada; `lock_carga` serializa as leituras do banco
+        self.lock = threading.Lock()
+        self.lock_carga = threading.Lock()
+        self.atualizando = None  # thread da recarga em segundo plano em andamento
+
+    def _carregar(self):
+        df = pd.read_sql_query(sql=text(self.sql), con=ENGINE)
+        df = df.astype({self.chave: "Int64"}).set_index(self.chave)
+        if "sub_brand_id" in df.columns:
+            df["sub_brand_id"] = df["sub_brand_id"].astype("Int32")
+        with self.lock:
+            self.df = df
+            self.carregado_em = time.time()
+        print(f"Dimensão carregada: {len(df)} linhas de {self.nome}.")
+
+    def _recarregar_em_segundo_plano(self):
+        try:
+            with self.lock_carga:
+                self._carregar()
+        except Exception as erro:
+            # continua servindo a tabela anterior; tenta de novo depois de INTERVALO_INCREMENTAL
+            print(f"Falha ao recarregar a dimensão {self.nome}: {erro}")
+            self.falha_em = time.time()
+        finally:
+            with self.lock:
+                self.atualizando = None
+
+    def _vencida(self):
+        agora = time.time()
+        return agora - self.carregado_em >= INTERVALO_DIMENSOES and agora - self.falha_em >= INTERVALO_INCREMENTAL
+
+    def obter(self, esperar=True):
+        with self.lock:
+            df = self.df
+            if df is not None:
+                if self.atualizando is None and self._vencida():
+                    self.atualizando = threading.Thread(
+                        target=self._recarregar_em_segundo_plano, name=f"dimensao-{self.nome}", daemon=True)
+                    self.atualizando.start()
+                return df
+        if not esperar:
+            return None
+        # primeira carga: não há o que servir, então espera (uma leitura só para todos)
+        with self.lock_carga:
+            if self.df is None:
+                self._carregar()
+        return self.df
+
+
+@st.cache_resource
+def _caches_dimensoes():
+    return {nome: _CacheDimensao(nome, sql, chave) for nome, (sql, chave) in TABELAS.items()}
+
+
+def tabela(nome):
+    """Tabela de dimensão indexada pela chave (compartilhada entre sessões: somente leitura)."""
+    return _caches_dimensoes()[nome].obter()
+
+
+def tabela_pronta(nome):
+    """Como `tabela`, mas devolve None em vez de esperar a primeira carga (ex.: durante o aquecimento)."""
+    return _caches_dimensoes()[nome].obter(esperar=False)
+
+
+def linhas(nome, chaves):
+    """Linhas da dimensão sob demanda `nome` para as `chaves` (Series de ids), indexadas pela chave."""
+    sql, chave = SOB_DEMANDA[nome]
+    ids = [int(c) for c in pd.unique(chaves.dropna())]
+    consulta = text(sql).bindparams(bindparam("ids", expanding=True))
+    df = pd.read_sql_query(sql=consulta, con=ENGINE, params={"ids": ids})
+    return df.astype({chave: "Int64"}).set_index(chave)
+
+
+def _chave(nome):
+    return (TABELAS.get(nome) or SOB_DEMANDA[nome])[1]
+
+
+def rotulo(df, coluna, dimensao=None):
+    """
+    Resolve o rótulo `coluna` para as linhas de `df` pela chave correspondente (store_id, channel_id...).
+    `dimensao` permite reaproveitar as linhas de uma dimensão sob demanda já buscadas para `df`.
+    """
+    nome = ROTULOS[coluna]
+    chave = _chave(nome)
+    if dimensao is None:
+        dimensao = tabela(nome) if nome in TABELAS else linhas(nome, df[chave])
+    valores = df[chave].map(dimensao[coluna])
+    if pd.api.types.is_integer_dtype(dimensao[coluna].dtype):
+        valores = valores.astype(dimensao[coluna].dtype)
+    reserva = RESERVAS.get(coluna)
+    if reserva is not None and reserva in df.columns:
+        valores = valores.fillna(df[reserva].astype(valores.dtype))
+    return valores.rename(coluna)
+
+
+def rotular(df, colunas):
+    """Acrescenta os rótulos pedidos a um frame pequeno (ex.: as 10 linhas de um ranking)."""
+    # uma consulta por dimensão sob demanda, para todos os rótulos dela
+    buscadas = {nome: linhas(nome, df[_chave(nome)])
+                for nome in dict.fromkeys(ROTULOS[c] for c in colunas) if nome in SOB_DEMANDA}
+    return df.assign(**{coluna: rotulo(df, coluna, buscadas.get(ROTULOS[coluna])) for coluna in colunas})
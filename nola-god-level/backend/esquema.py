@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+# Esquema compacto aplicado aos frames logo após a leitura do banco.
+# - dimensões de baixa cardinalidade viram category
+# - ids viram inteiros anuláveis
+# - dinheiro vira centavos inteiros (coluna "<nome>_centavos"): somas continuam exatas
+# - "dia" é o número de dias desde 1970-01-01 (int32), no lugar de objetos date
+
+EPOCA = pd.Timestamp("1970-01-01")
+
+ESQUEMA_VENDAS = {
+    "id": "Int64",
+    "store_id": "Int32",
+    "channel_id": "Int32",
+    "customer_id": "Int32",
+    "sale_status_desc": "category",
+    "customer_name_venda": "category",
+}
+MONETARIAS_VENDAS = ["total_amount", "total_discount", "delivery_fee"]
+
+ESQUEMA_ITENS = {
+    "sale_id": "Int64",
+    "product_id": "Int32",
+    "sub_brand_id": "Int32",
+    "product_name": "category",
+    "sale_status_desc": "category",
+    "product_sub_brand_name": "category",
+    "quantity": "float32",
+}
+MONETARIAS_ITENS = ["item_total_amount"]
+
+
+def centavos(coluna):
+    return f"{coluna}_centavos"
+
+
+def reais(valor):
+    """Converte centavos (escalar ou Series) de volta para reais."""
+    return valor / 100
+
+
+def dia_ordinal(data):
+    """date/datetime -> número de dias desde 1970-01-01."""
+    return (pd.Timestamp(data).normalize() - EPOCA).days
+
+
+def serie_dia_ordinal(timestamps):
+    return ((timestamps.dt.tz_localize(None) if timestamps.dt.tz is not None else timestamps)
+            .dt.normalize().sub(EPOCA).dt.days.astype("int32"))
+
+
+def data_do_ordinal(dias):
+    """Series de dias -> Series de objetos date (só para o resultado já agregado)."""
+    return (EPOCA + pd.to_timedelta(dias.astype("int64"), unit="D")).dt.date
+
+
+def dia_da_semana(dias):
+    """Segunda = 0 ... Domingo = 6 (01/01/1970 foi quinta-feira)."""
+    return (dias + 3) % 7
+
+
+def semana_do_ordinal(dias):
+    """Series de dias -> date da segunda-feira da semana."""
+    return data_do_ordinal(dias - dia_da_semana(dias))
+
+
+def mes_do_ordinal(dias):
+    """Series de dias -> date do primeiro dia do mês."""
+    datas = EPOCA + pd.to_timedelta(dias.astype("int64"), unit="D")
+    return (datas - pd.to_timedelta(datas.dt.day - 1, unit="D")).dt.date
+
+
+def memoria_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def aplicar_esquema(df, tipos, monetarias, col_data):
+    """Converte um frame recém-lido do banco para o esquema compacto."""
+    df = df.copy(deep=False)
+    for col in monetarias:
+        df[centavos(col)] = np.rint(df[col].astype("float64").fillna(0) * 100).astype("int32")
+    df = df.drop(columns=monetarias)
+    for col, tipo in tipos.items():
+        if col in df.columns:
+            df[col] = df[col].astype(tipo)
+    df["dia"] = serie_dia_ordinal(pd.to_datetime(df[col_data]))
+    return df
+
+
+def concatenar(frames):
+    """pd.concat preservando as colunas category (une as categorias antes, sem voltar para object)."""
+    frames = [f.copy(deep=False) for f in frames]
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categorias = frames[0][col].cat.categories
+            for f in frames[1:]:
+                categorias = categorias.append(f[col].cat.categories.difference(categorias))
+            for f in frames:
+                f[col] = f[col].cat.set_categories(categorias)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,85 @@
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+from psycopg2.extensions import encodings
+from pyarrow import csv as pacsv
+from sqlalchemy import text
+
+# Extração alternativa: COPY (consulta) TO STDOUT em CSV, lido em streaming pelo parser do pyarrow.
+# Evita a construção de um objeto Python por célula do psycopg2 + read_sql_query.
+TAMANHO_BLOCO_COPY = int(os.getenv("TAMANHO_BLOCO_COPY", str(16 * 1024 * 1024)))  # bytes de CSV por lote
+
+
+def _consulta_literal(cursor, engine, sql, params):
+    """Renderiza a consulta com os parâmetros já escapados pelo driver (COPY não aceita bind params)."""
+    compilada = str(text(sql).compile(dialect=engine.dialect))
+    return cursor.mogrify(compilada, params or {}).decode(encodings.get(cursor.connection.encoding, "utf-8"))
+
+
+def _converter_datas(df, colunas_data):
+    for col in colunas_data:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def ler_lotes_copy(engine, sql, params=None, tipos=None, colunas_data=()):
+    """
+    Executa a consulta via COPY e devolve um gerador de DataFrames (um por bloco de CSV).
+
+    O psycopg2 escreve o CSV num pipe numa thread; o pyarrow lê o outro lado já convertendo
+    cada coluna para o tipo final, então o resultado nunca existe inteiro como texto em memória.
+
+    Args:
+        engine: engine SQLAlchemy com driver psycopg2 (db_config.get_db_engine()).
+        sql (str): consulta no formato do sqlalchemy.text (parâmetros ":nome").
+        params (dict | None): valores dos parâmetros.
+        tipos (dict | None): coluna -> tipo arrow ("string", "int64", "float64"); as demais são inferidas.
+        colunas_data: colunas de timestamp (convertidas com pd.to_datetime se o pyarrow não inferir).
+    """
+    conexao = engine.raw_connection()
+    produtor = None
+    try:
+        cursor = conexao.cursor()
+        comando = f"COPY ({_consulta_literal(cursor, engine, sql, params)}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+        leitura, escrita = os.pipe()
+        erros = []
+
+        def produzir():
+            try:
+                with os.fdopen(escrita, "wb") as destino:
+                    cursor.copy_expert(comando, destino)
+            except Exception as erro:  # repassado para a thread que consome (inclui o pipe fechado por ela)
+                erros.append(erro)
+
+        produtor = threading.Thread(target=produzir, name="copy-produtor", daemon=True)
+        produtor.start()
+        with os.fdopen(leitura, "rb") as origem:
+            leitor = pacsv.open_csv(
+                origem,
+                read_options=pacsv.ReadOptions(block_size=TAMANHO_BLOCO_COPY),
+                convert_options=pacsv.ConvertOptions(
+                    column_types={col: pa.type_for_alias(tipo) for col, tipo in (tipos or {}).items()},
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,  # "" é texto vazio; campo vazio sem aspas é NULL
+                ),
+            )
+            vazio = True
+            for lote in leitor:
+                vazio = False
+                yield _converter_datas(lote.to_pandas(), colunas_data)
+            if vazio:  # mesmo contrato do read_sql_query: ao menos um frame, com as colunas
+                yield _converter_datas(leitor.schema.empty_table().to_pandas(), colunas_data)
+        produtor.join()
+        if erros:
+            raise erros[0]
+    finally:
+        if produtor is not None and produtor.is_alive():
+            # o consumidor parou antes do fim (gerador fechado ou erro na leitura): o lado de leitura do
+            # pipe já foi fechado; cancela o COPY no servidor e espera a thread largar o cursor
+            conexao.cancel()
+            produtor.join()
+        conexao.close()
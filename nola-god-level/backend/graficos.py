@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from .agregacao import agregar
+from .instrumentacao import cronometrar
+
+# Séries temporais das páginas: a granularidade acompanha o tamanho do período (hora, dia, semana,
+# mês) e, se ainda assim passar de PONTOS_MAX_GRAFICO pontos, a série é reduzida no servidor pelo
+# LTTB (mantém picos e vales). Acima de LIMITE_WEBGL_GRAFICO pontos o traço vira WebGL (scattergl).
+PONTOS_MAX_GRAFICO = int(os.getenv("PONTOS_MAX_GRAFICO", "1500"))
+LIMITE_WEBGL_GRAFICO = int(os.getenv("LIMITE_WEBGL_GRAFICO", "1000"))
+
+# granularidade -> rótulo; escolha automática pelo número de dias do período (até o limite)
+GRANULARIDADES = {"hora": "por hora", "dia": "por dia", "semana": "por semana", "mes": "por mês"}
+DIAS_MAX_GRANULARIDADE = {"hora": 3, "dia": 400, "semana": 3 * 365}
+# opções do seletor das páginas (None = automática)
+OPCOES_GRANULARIDADE = {"Automática": None, "Hora": "hora", "Dia": "dia", "Semana": "semana", "Mês": "mes"}
+
+
+def escolher_granularidade(periodo):
+    """Granularidade mais fina cujo número de pontos continua razoável para o período (date, date)."""
+    dias = (periodo[1] - periodo[0]).days + 1
+    for granularidade, maximo in DIAS_MAX_GRANULARIDADE.items():
+        if dias <= maximo:
+            return granularidade
+    return "mes"
+
+
+def serie_temporal(metricas, periodo, filtros, granularidade=None):
+    """
+    Métricas por instante (coluna "data") na granularidade pedida ou escolhida pelo período.
+
+    Returns:
+        tuple[pd.DataFrame, str]: frame ordenado por "data" e a granularidade usada.
+    """
+    granularidade = granularidade or escolher_granularidade(periodo)
+    if granularidade == "hora":
+        df = agregar(metricas, ["sale_date", "hora"], periodo, filtros)
+        df["data"] = pd.to_datetime(df["sale_date"]) + pd.to_timedelta(df["hora"], unit="h")
+    else:
+        dimensao = "sale_date" if granularidade == "dia" else granularidade
+        df = agregar(metricas, [dimensao], periodo, filtros).rename(columns={dimensao: "data"})
+    df = df.sort_values("data")[["data"] + list(metricas)].reset_index(drop=True)
+    return df, granularidade
+
+
+def lttb(x, y, n):
+    """
+    Índices dos `n` pontos escolhidos pelo Largest-Triangle-Three-Buckets: o primeiro, o último e,
+    em cada balde intermediário, o que forma o maior triângulo com o escolhido antes e a média do
+    balde seguinte.
+    """
+    total = len(x)
+    if n >= total or n < 3:
+        return np.arange(total)
+    indices = np.empty(n, dtype=np.int64)
+    indices[0], indices[-1] = 0, total - 1
+    limites = np.linspace(1, total - 1, n - 1).astype(np.int64)
+    anterior = 0
+    for i in range(n - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        seguinte = slice(limites[i + 1], limites[i + 2]) if i + 2 < n - 1 else slice(total - 1, total)
+        mx, my = x[seguinte].mean(), y[seguinte].mean()
+        ax, ay = x[anterior], y[anterior]
+        areas = np.abs((ax - mx) * (y[inicio:fim] - ay) - (ax - x[inicio:fim]) * (my - ay))
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+@cronometrar("graficos.linha")
+def grafico_linha(df, x, y, **kwargs):
+    """px.line com no máximo PONTOS_MAX_GRAFICO pontos (LTTB) e WebGL acima de LIMITE_WEBGL_GRAFICO."""
+    if len(df) > PONTOS_MAX_GRAFICO:
+        eixo = pd.to_datetime(df[x]).astype("int64").to_numpy(dtype="float64")
+        valores = np.nan_to_num(df[y].to_numpy(dtype="float64"))
+        df = df.iloc[lttb(eixo, valores, PONTOS_MAX_GRAFICO)]
+    if len(df) > LIMITE_WEBGL_GRAFICO:
+        kwargs["render_mode"] = "webgl"
+        kwargs.pop("line_shape", None)  # o scattergl não desenha spline
+    return px.line(df, x=x, y=y, **kwargs)
@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from sqlalchemy import event
+
+from .cache_resultados import estatisticas as estatisticas_cache
+from .esquema import memoria_mb
+
+# Medições do caminho quente: tempo das consultas SQL (eventos do engine), trechos nomeados
+# (carga, transformações, páginas, figuras, Gemini) e memória dos frames residentes.
+# Alimenta o painel "Desempenho" (PAINEL_DESEMPENHO=1) e o texto no formato do Prometheus.
+PAINEL_DESEMPENHO = os.getenv("PAINEL_DESEMPENHO", "0").lower() in ("1", "true", "sim")
+# se definido, o texto das métricas é regravado nesse arquivo a cada execução de página
+# (coletor "textfile" do node_exporter)
+ARQUIVO_METRICAS = os.getenv("ARQUIVO_METRICAS", "")
+
+# trechos da execução (rerun) corrente da sessão: lista de (profundidade, nome, segundos)
+_execucao = contextvars.ContextVar("execucao_desempenho", default=None)
+_profundidade = contextvars.ContextVar("profundidade_desempenho", default=0)
+
+
+class _Registro:
+    """Acumulados do processo (todas as sessões): chamadas, tempo total e máximo por trecho e por consulta."""
+
+    def __init__(self):
+        self.trechos = {}
+        self.consultas = {}
+        self.frames = {}
+        self.lock = threading.Lock()
+
+    def somar(self, tabela, nome, segundos):
+        with self.lock:
+            chamadas, total, maximo = tabela.get(nome, (0, 0.0, 0.0))
+            tabela[nome] = (chamadas + 1, total + segundos, max(maximo, segundos))
+
+
+@st.cache_resource
+def _registro():
+    return _Registro()
+
+
+def registrar_tempo(nome, segundos):
+    """Duração medida por fora (ex.: geradores, que não podem abrir um `trecho` entre os yields)."""
+    _registro().somar(_registro().trechos, nome, segundos)
+    execucao = _execucao.get()
+    if execucao is not None:
+        execucao.append((_profundidade.get(), nome, segundos))
+
+
+@contextmanager
+def trecho(nome):
+    """Mede o bloco como o trecho `nome` (acumulado do processo + detalhamento da execução corrente)."""
+    profundidade = _profundidade.set(_profundidade.get() + 1)
+    posicao = len(_execucao.get() or [])
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        _profundidade.reset(profundidade)
+        _registro().somar(_registro().trechos, nome, segundos)
+        execucao = _execucao.get()
+        if execucao is not None:
+            # entra antes dos trechos internos, que terminaram primeiro
+            execucao.insert(posicao, (_profundidade.get(), nome, segundos))
+
+
+def cronometrar(nome):
+    """Decorador: cada chamada da função vira um trecho `nome`."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with trecho(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+
+@contextmanager
+def execucao(pagina):
+    """
+    Coleta os trechos de uma execução (rerun) da página; devolve a lista (profundidade, nome, segundos).
+
+    Os trechos medidos em outras threads (ex.: recarga em segundo plano) entram só nos acumulados.
+    """
+    coleta = []
+    token = _execucao.set(coleta)
+    try:
+        with trecho(f"pagina:{pagina}"):
+            yield coleta
+    finally:
+        _execucao.reset(token)
+        if ARQUIVO_METRICAS:
+            gravar_metricas(ARQUIVO_METRICAS)
+
+
+def registrar_frame(nome, df):
+    """Memória (deep) de um frame residente, exposta por nome."""
+    with _registro().lock:
+        _registro().frames[nome] = (len(df), memoria_mb(df) * 1024 ** 2)
+
+
+def esquecer_frames(nomes):
+    """Remove os frames de uma partição descartada (pelos nomes exatos)."""
+    with _registro().lock:
+        for nome in nomes:
+            _registro().frames.pop(nome, None)
+
+
+# ---------------------------------------------------------------- SQL
+
+def _nome_consulta(sql):
+    # verbo + primeira tabela do FROM: "SELECT sales", "COPY product_sales"
+    verbo = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+    tabela = re.search(r"\bFROM\s+([\w.]+)", sql, re.IGNORECASE)
+    return f"{verbo} {tabela.group(1)}" if tabela else verbo
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    segundos = time.perf_counter() - conn.info["inicio_consulta"].pop()
+    nome = _nome_consulta(statement)
+    _registro().somar(_registro().consultas, nome, segundos)
+    execucao = _execucao.get()
+    if execucao is not None:
+        execucao.append((_profundidade.get(), f"sql:{nome}", segundos))
+
+
+def instrumentar_engine(engine):
+    """Eventos do SQLAlchemy no engine: tempo de execução de cada consulta (até o primeiro lote do cursor)."""
+    if not event.contains(engine, "before_cursor_execute", _antes):
+        event.listen(engine, "before_cursor_execute", _antes)
+        event.listen(engine, "after_cursor_execute", _depois)
+
+
+# ---------------------------------------------------------------- páginas
+
+class _ModuloMedido:
+    """Proxy de um módulo (ex.: plotly.express) cujas funções viram trechos `prefixo.funcao`."""
+
+    def __init__(self, modulo, prefixo):
+        self._modulo = modulo
+        self._prefixo = prefixo
+
+    def __getattr__(self, nome):
+        valor = getattr(self._modulo, nome)
+        if callable(valor):
+            return cronometrar(f"{self._prefixo}.{nome}")(valor)
+        return valor
+
+
+def instrumentar_pagina(modulo, pagina):
+    """Mede cada função definida no módulo da página e a montagem das figuras do Plotly (px.*)."""
+    for nome, valor in list(vars(modulo).items()):
+        if callable(valor) and getattr(valor, "__module__", None) == modulo.__name__ and nome != "app":
+            setattr(modulo, nome, cronometrar(f"{pagina}.{nome}")(valor))
+    if hasattr(modulo, "px"):
+        modulo.px = _ModuloMedido(modulo.px, "plotly")
+    return modulo
+
+
+# ---------------------------------------------------------------- saída
+
+def resumo():
+    """(trechos, consultas, frames) acumulados, para o painel."""
+    registro = _registro()
+    with registro.lock:
+        return dict(registro.trechos), dict(registro.consultas), dict(registro.frames)
+
+
+def _rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def texto_prometheus():
+    """Métricas no formato de exposição de texto do Prometheus."""
+    trechos, consultas, frames = resumo()
+    linhas = []
+    for metrica, tabela, rotulo in (("nola_trecho", trechos, "trecho"), ("nola_consulta_sql", consultas, "consulta")):
+        for sufixo, tipo, indice, ajuda in (("chamadas_total", "counter", 0, "Execuções"),
+                                             ("segundos_total", "counter", 1, "Tempo acumulado (s)"),
+                                             ("segundos_max", "gauge", 2, "Maior duração (s)")):
+            linhas += [f"# HELP {metrica}_{sufixo} {ajuda}", f"# TYPE {metrica}_{sufixo} {tipo}"]
+            linhas += [f'{metrica}_{sufixo}{{{rotulo}="{_rotulo(nome)}"}} {valores[indice]:.6g}'
+                       for nome, valores in sorted(tabela.items())]
+    linhas += ["# HELP nola_frame_bytes Memória dos frames residentes", "# TYPE nola_frame_bytes gauge"]
+    linhas += [f'nola_frame_bytes{{frame="{_rotulo(nome)}"}} {int(tamanho)}' for nome, (_, tamanho) in sorted(frames.items())]
+    linhas += ["# HELP nola_frame_linhas Linhas dos frames residentes", "# TYPE nola_frame_linhas gauge"]
+    linhas += [f'nola_frame_linhas{{frame="{_rotulo(nome)}"}} {linhas_}' for nome, (linhas_, _) in sorted(frames.items())]
+    cache = estatisticas_cache()
+    for sufixo, indice, ajuda in (("acertos_total", 0, "Acertos"), ("erros_total", 1, "Erros (resultado calculado)")):
+        linhas += [f"# HELP nola_cache_resultados_{sufixo} {ajuda} do cache de resultados",
+                   f"# TYPE nola_cache_resultados_{sufixo} counter"]
+        linhas += [f'nola_cache_resultados_{sufixo}{{pagina="{_rotulo(pagina)}"}} {valores[indice]}'
+                   for pagina, valores in cache["paginas"].items()]
+    linhas += ["# HELP nola_cache_resultados_bytes Memória do cache de resultados", "# TYPE nola_cache_resultados_bytes gauge",
+               f"nola_cache_resultados_bytes {cache['bytes']}",
+               "# HELP nola_cache_resultados_entradas Entradas do cache de resultados", "# TYPE nola_cache_resultados_entradas gauge",
+               f"nola_cache_resultados_entradas {cache['entradas']}"]
+    return "\n".join(linhas) + "\n"
+
+
+def gravar_metricas(caminho):
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        arquivo.write(texto_prometheus())
+    os.replace(temporario, caminho)  # o coletor nunca lê um arquivo pela metade
@@ -1,5 +1,13 @@
-import pandas as pd
 import json
+import threading
+from collections import OrderedDict
+from .carregador_dados import _cache_itens, _cache_vendas
+from .clientes import primeira_compra
+from .dimensoes import rotulo
+from .esquema import centavos, reais
+from .instrumentacao import cronometrar
+from .metricas import TabelaFatorada
+from .visoes import fatiar_periodo, itens_concluidos, vendas_concluidas
 
 # Descrição do schema do banco de dados (contexto para IA)
 SCHEMA_DB_DESCRIPTION = """
@@ -7,60 +15,89 @@ A base de dados inclui tabelas como 'sales', 'product_sales', 'products', etc.,
 Foco em vendas e produtos para análises.
 """
 
-def _filtrar_por_periodo(df, data_inicio, data_fim, coluna_data='sale_date'):
-    """Filtra DataFrame por período de datas."""
-    df[coluna_data] = pd.to_datetime(df[coluna_data]).dt.date
-    return df[(df[coluna_data] >= data_inicio) & (df[coluna_data] <= data_fim)].copy()
+# Quantos contextos prontos (um por período) são guardados por versão dos dados
+MAX_CONTEXTOS = 32
 
-def _calcular_kpis_gerais(df_vendas):
+def _filtrar_por_periodo(df, data_inicio, data_fim, coluna_dia='dia'):
+    """Filtra DataFrame (ordenado por dia) por período de datas: busca binária, sem copiar."""
+    return fatiar_periodo(df, data_inicio, data_fim, coluna_dia)
+
+@cronometrar("ia:parciais_diarios")
+def _parciais_diarios(df_vendas, df_itens):
+    """
+    Agregados parciais por dia que alimentam as cinco análises (somáveis entre dias).
+    
+    Vendas: (dia, loja, canal) -> faturamento, pedidos, pedidos identificados e pedidos de cliente novo.
+    Itens: (dia, produto) -> quantidade e faturamento. Ambos saem ordenados por dia.
+    """
+    df_vendas = df_vendas[df_vendas['sale_status_desc'] == 'COMPLETED']
+    identificado = df_vendas['customer_id'].notna()
+    # primeira compra global vem da tabela de estado dos clientes (mantida a cada carga), sem groupby + merge
+    novo = (df_vendas['dia'].to_numpy() == primeira_compra(df_vendas['customer_id'])) & identificado
+    vendas = TabelaFatorada(df_vendas[['dia', 'store_id', 'channel_id', centavos('total_amount')]].assign(
+        identificado=identificado.astype('int32'), novo=novo.astype('int32')
+    )).agregar({
+        'faturamento': centavos('total_amount'),
+        'pedidos': None,
+        'identificados': 'identificado',
+        'novos': 'novo',
+    }, ['dia', 'store_id', 'channel_id'], dropna=False)
+    
+    df_itens = df_itens[df_itens['sale_status_desc'] == 'COMPLETED']
+    itens = TabelaFatorada(df_itens).agregar({
+        'quantity': 'quantity',
+        'faturamento': centavos('item_total_amount'),
+    }, ['dia', 'product_id', 'product_name'])
+    return vendas, itens
+
+def _calcular_kpis_gerais(totais):
     """Calcula KPIs gerais: faturamento, transações e ticket médio."""
-    total_faturamento = df_vendas['total_amount'].sum()
-    total_transacoes = len(df_vendas)
+    total_faturamento = reais(totais['faturamento'].sum())
+    total_transacoes = int(totais['pedidos'].sum())
     aov = total_faturamento / total_transacoes if total_transacoes > 0 else 0
     return total_faturamento, total_transacoes, aov
 
-def _analisar_clientes(df_vendas, df_vendas_concluidas):
+def _analisar_clientes(totais):
     """Analisa clientes: novos, recorrentes e não identificados."""
-    df_primeira_compra = df_vendas.dropna(subset=['customer_id']).groupby('customer_id')['sale_date'].min().reset_index()
-    df_primeira_compra.rename(columns={'sale_date': 'primeira_compra_global'}, inplace=True)
-    
-    df_temp = pd.merge(df_vendas_concluidas, df_primeira_compra, on='customer_id', how='left')
-    is_identified = df_temp['customer_id'].notna()
-    is_first = (df_temp['sale_date'] == df_temp['primeira_compra_global']) & is_identified
-    
-    pedidos_novo = is_first.sum()
-    pedidos_recorrente = (is_identified & ~is_first).sum()
-    vendas_identificadas = pedidos_novo + pedidos_recorrente
-    pedidos_nao_identificados = (~is_identified).sum()
-    pct_identificados = (vendas_identificadas / len(df_temp)) * 100 if len(df_temp) > 0 else 0
+    total = int(totais['pedidos'].sum())
+    vendas_identificadas = int(totais['identificados'].sum())
+    pedidos_novo = int(totais['novos'].sum())
+    pedidos_recorrente = vendas_identificadas - pedidos_novo
+    pedidos_nao_identificados = total - vendas_identificadas
+    pct_identificados = (vendas_identificadas / total) * 100 if total > 0 else 0
     
     return pedidos_novo, pedidos_recorrente, pct_identificados, pedidos_nao_identificados
 
-def _analisar_lojas(df_vendas):
+def _analisar_lojas(por_loja):
     """Analisa performance de lojas: top e piores 5."""
-    df_lojas = df_vendas.groupby('store_id')['total_amount'].sum().reset_index()
+    df_lojas = por_loja[['store_id']].assign(total_amount=reais(por_loja['faturamento']))
     top_5 = df_lojas.nlargest(5, 'total_amount').to_dict('records')
     bottom_5 = df_lojas.nsmallest(5, 'total_amount').to_dict('records')
     return top_5, bottom_5
 
-def _analisar_produtos(df_itens):
+def _analisar_produtos(df_produtos):
     """Analisa produtos: top/bottom por quantidade e faturamento."""
-    df_qnt = df_itens.groupby(['product_id', 'product_name'])['quantity'].sum().reset_index()
+    
+    df_qnt = df_produtos[['product_id', 'product_name', 'quantity']]
     top_qnt = df_qnt.nlargest(5, 'quantity').to_dict('records')
     bottom_qnt = df_qnt.nsmallest(5, 'quantity').to_dict('records')
     
-    df_fat = df_itens.groupby(['product_id', 'product_name'])['item_total_amount'].sum().reset_index()
+    df_fat = df_produtos[['product_id', 'product_name']].assign(item_total_amount=reais(df_produtos['faturamento']))
     top_fat = df_fat.nlargest(5, 'item_total_amount').to_dict('records')
     bottom_fat = df_fat.nsmallest(5, 'item_total_amount').to_dict('records')
     
     return top_qnt, bottom_qnt, top_fat, bottom_fat
 
-def _analisar_canais(df_vendas):
+def _analisar_canais(por_canal):
     """Analisa canais de venda: faturamento e percentuais."""
-    df_canais = df_vendas.groupby(['channel_id', 'channel_name']).agg(
-        Nro_Vendas=('id', 'nunique'),
-        Faturamento_Total=('total_amount', 'sum')
-    ).reset_index()
+    df_canais = por_canal[['channel_id']].assign(
+        Nro_Vendas=por_canal['pedidos'],
+        Faturamento_Total=por_canal['faturamento'],
+    )
+    # nome do canal vem da tabela de dimensão, depois de agregar
+    df_canais.insert(1, 'channel_name', rotulo(df_canais, 'channel_name'))
+    df_canais = df_canais.dropna(subset=['channel_name'])
+    df_canais['Faturamento_Total'] = reais(df_canais['Faturamento_Total'])
     
     total_faturamento = df_canais['Faturamento_Total'].sum()
     df_canais['Percentual_Faturamento'] = (df_canais['Faturamento_Total'] / total_faturamento * 100).round(2) if total_faturamento > 0 else 0
@@ -70,27 +107,23 @@ def _analisar_canais(df_vendas):
     
     return total_faturamento, top_canais
 
-def gerar_contexto_analise(df_vendas, df_itens, data_inicio, data_fim):
-    """
-    Gera contexto JSON estruturado para IA a partir de DataFrames de vendas e itens.
+@cronometrar("ia:contexto")
+def _contexto_de_parciais(parciais, data_inicio, data_fim):
+    df_vendas, df_itens = (_filtrar_por_periodo(df, data_inicio, data_fim) for df in parciais)
+    # uma tabela fatorada por período: totais, lojas e canais saem dos mesmos códigos
+    totais, por_loja, por_canal = TabelaFatorada(df_vendas).agregar_varios(
+        {'faturamento': 'faturamento', 'pedidos': 'pedidos', 'identificados': 'identificados', 'novos': 'novos'},
+        [[], ['store_id'], ['channel_id']],
+    )
+    produtos = TabelaFatorada(df_itens).agregar(
+        {'quantity': 'quantity', 'faturamento': 'faturamento'}, ['product_id', 'product_name'],
+    )
     
-    Args:
-        df_vendas (pd.DataFrame): DataFrame de vendas.
-        df_itens (pd.DataFrame): DataFrame de itens.
-        data_inicio (date): Data de início.
-        data_fim (date): Data de fim.
-    
-    Returns:
-        str: JSON com KPIs e análises.
-    """
-    df_vendas_concluidas = df_vendas[df_vendas['sale_status_desc'] == 'COMPLETED'].copy()
-    df_itens_final = _filtrar_por_periodo(df_itens, data_inicio, data_fim)
-    
-    total_faturamento, total_transacoes, aov = _calcular_kpis_gerais(df_vendas_concluidas)
-    pedidos_novo, pedidos_recorrente, pct_identificados, pedidos_nao_identificados = _analisar_clientes(df_vendas, df_vendas_concluidas)
-    top_lojas, bottom_lojas = _analisar_lojas(df_vendas_concluidas)
-    top_qnt, bottom_qnt, top_fat, bottom_fat = _analisar_produtos(df_itens_final)
-    total_fat_canais, top_canais = _analisar_canais(df_vendas_concluidas)
+    total_faturamento, total_transacoes, aov = _calcular_kpis_gerais(totais)
+    pedidos_novo, pedidos_recorrente, pct_identificados, pedidos_nao_identificados = _analisar_clientes(totais)
+    top_lojas, bottom_lojas = _analisar_lojas(por_loja)
+    top_qnt, bottom_qnt, top_fat, bottom_fat = _analisar_produtos(produtos)
+    total_fat_canais, top_canais = _analisar_canais(por_canal)
     
     contexto = {
         "Periodo_Analise": f"De {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}",
@@ -120,4 +153,70 @@ def gerar_contexto_analise(df_vendas, df_itens, data_inicio, data_fim):
             "Top_Canais_por_Faturamento": top_canais
         }
     }
-    return json.dumps(contexto, indent=2, ensure_ascii=False)
\ No newline at end of file
+    return json.dumps(contexto, indent=2, ensure_ascii=False)
+
+def gerar_contexto_analise(df_vendas, df_itens, data_inicio, data_fim):
+    """
+    Gera contexto JSON estruturado para IA a partir de DataFrames de vendas e itens.
+    
+    Args:
+        df_vendas (pd.DataFrame): DataFrame de vendas.
+        df_itens (pd.DataFrame): DataFrame de itens.
+        data_inicio (date): Data de início.
+        data_fim (date): Data de fim.
+    
+    Returns:
+        str: JSON com KPIs e análises.
+    """
+    return _contexto_de_parciais(_parciais_diarios(df_vendas, df_itens), data_inicio, data_fim)
+
+
+class _ContextosIA:
+    """Parciais diários por versão dos dados + contextos prontos por período (LRU)."""
+    
+    def __init__(self):
+        self.versao = None
+        self.parciais = None
+        self.contextos = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def _sincronizar(self):
+        # chamado com self.lock: refaz os parciais se os dados mudaram de versão
+        df_vendas, df_itens = vendas_concluidas(), itens_concluidos()
+        versao = (_cache_vendas().versao, _cache_itens().versao)
+        if self.versao != versao:
+            self.parciais = _parciais_diarios(df_vendas, df_itens)
+            self.contextos.clear()
+            self.versao = versao
+
+    def preparar(self):
+        with self.lock:
+            self._sincronizar()
+
+    def obter(self, data_inicio, data_fim):
+        with self.lock:
+            self._sincronizar()
+            chave = (data_inicio, data_fim)
+            if chave not in self.contextos:
+                self.contextos[chave] = _contexto_de_parciais(self.parciais, data_inicio, data_fim)
+                if len(self.contextos) > MAX_CONTEXTOS:
+                    self.contextos.popitem(last=False)
+            self.contextos.move_to_end(chave)
+            return self.contextos[chave]
+
+def _contextos_ia():
+    # um por partição de dados (guardado junto com o cache de vendas dela)
+    return _cache_vendas().derivado("contextos_ia", _ContextosIA)
+
+def contexto_analise(data_inicio, data_fim):
+    """
+    Mesmo JSON de gerar_contexto_analise para os dados atuais, memoizado por (versão dos dados, período).
+    
+    Perguntas seguintes no mesmo período não recalculam nada; um período novo é montado a partir
+    dos parciais diários (alguns milhares de linhas), não das vendas e itens linha a linha.
+    """
+    return _contextos_ia().obter(data_inicio, data_fim)
+
+def preparar_contexto_analise():
+    """Monta os parciais diários da versão atual dos dados, para o primeiro contexto sair sem esperar."""
+    _contextos_ia().preparar()
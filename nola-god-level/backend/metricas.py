@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+# Núcleo de agregação usado pelo cubo, pelas agregações em memória e pelo contexto da IA.
+# Cada coluna-chave é fatorada uma vez (códigos inteiros 0..k-1, -1 = nulo) e os códigos são
+# reaproveitados por todos os agrupamentos pedidos sobre o mesmo frame; cada agrupamento é
+# uma combinação dos códigos + np.bincount por medida, sem o groupby do pandas.
+
+# acima disso (produto das cardinalidades) os grupos são enumerados com np.unique em vez de bincount denso
+LIMITE_DENSO = 1 << 22
+
+
+class TabelaFatorada:
+    """Frame + códigos fatorados por coluna, calculados uma vez e compartilhados entre agrupamentos."""
+
+    def __init__(self, df):
+        self.df = df
+        self._codigos = {}
+        self._valores = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def codigos(self, coluna):
+        """(códigos int64 por linha, valores distintos ordenados); nulo = -1."""
+        if coluna not in self._codigos:
+            serie = self.df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                self._codigos[coluna] = (serie.cat.codes.to_numpy().astype("int64"), serie.cat.categories)
+            else:
+                codigos, valores = pd.factorize(serie, sort=True)
+                self._codigos[coluna] = (codigos.astype("int64"), pd.Index(valores))
+        return self._codigos[coluna]
+
+    def derivar(self, nome, base, funcao):
+        """
+        Coluna-chave `nome` determinada por `base` (ex.: estado pela loja, data pelo dia).
+
+        `funcao` recebe só os valores distintos da base e devolve o valor derivado de cada um;
+        os códigos por linha saem da composição, sem calcular nada linha a linha.
+        """
+        if nome not in self._codigos:
+            codigos_base, valores_base = self.codigos(base)
+            derivados = pd.Series(funcao(pd.Series(valores_base))).reset_index(drop=True)
+            codigos_derivados, valores = pd.factorize(derivados, sort=True)
+            mapa = np.append(codigos_derivados, -1)  # posição extra: base nula -> derivado nulo
+            self._codigos[nome] = (mapa[codigos_base].astype("int64"), pd.Index(valores))
+        return self._codigos[nome]
+
+    def incluir(self, nome, serie):
+        """Coluna-chave calculada fora do frame (uma Series alinhada às linhas)."""
+        if nome not in self._codigos:
+            codigos, valores = pd.factorize(serie, sort=True)
+            self._codigos[nome] = (codigos.astype("int64"), pd.Index(valores))
+        return self._codigos[nome]
+
+    def mascara(self, coluna, valores):
+        """Linhas cuja `coluna` está em `valores` (escalar ou lista), avaliado nos valores distintos."""
+        codigos, distintos = self.codigos(coluna)
+        lista = list(valores) if isinstance(valores, (list, tuple, set)) else [valores]
+        aceitos = np.append(distintos.isin(lista), False)
+        return aceitos[codigos]
+
+    def filtrar(self, mascara):
+        """Nova tabela só com as linhas da máscara, reaproveitando os códigos já calculados."""
+        filtrada = TabelaFatorada(self.df[mascara])
+        filtrada._codigos = {c: (cod[mascara], valores) for c, (cod, valores) in self._codigos.items()}
+        filtrada._valores = {c: v[mascara] for c, v in self._valores.items()}
+        return filtrada
+
+    def _medida(self, coluna):
+        if coluna not in self._valores:
+            valores = self.df[coluna].to_numpy()
+            # soma ignora nulos, como o pandas
+            self._valores[coluna] = np.nan_to_num(valores) if valores.dtype.kind == "f" else valores
+        return self._valores[coluna]
+
+    def agregar(self, medidas, chaves=(), dropna=True):
+        """
+        Soma as medidas por grupo das chaves (mesmo resultado de groupby(chaves, observed=True).agg(...)).
+
+        Args:
+            medidas (dict): nome do resultado -> coluna somada, ou None para contar linhas.
+            chaves (list): colunas-chave (fatoradas com `codigos` ou registradas com `derivar`).
+            dropna (bool): descarta linhas com chave nula (como o groupby); False mantém o grupo nulo.
+        """
+        chaves = list(chaves)
+        if not chaves:
+            return pd.DataFrame([{nome: len(self) if col is None else self._medida(col).sum()
+                                  for nome, col in medidas.items()}])
+
+        codigos = [self.codigos(c) for c in chaves]
+        selecao = None
+        if dropna:
+            for cod, _ in codigos:
+                selecao = cod >= 0 if selecao is None else selecao & (cod >= 0)
+        # combina os códigos em um inteiro por linha (base mista); nulo vira a última posição de cada chave
+        tamanhos = [len(valores) + 1 for _, valores in codigos]
+        combinado = np.zeros(len(self), dtype="int64")
+        for (cod, valores), tamanho in zip(codigos, tamanhos):
+            combinado = combinado * tamanho + np.where(cod >= 0, cod, len(valores))
+        if selecao is not None:
+            combinado = combinado[selecao]
+
+        total = int(np.prod(tamanhos, dtype="float64"))
+        if total <= LIMITE_DENSO:
+            contagem = np.bincount(combinado, minlength=total)
+            grupos = np.flatnonzero(contagem)
+            posicao = np.zeros(total, dtype="int64")
+            posicao[grupos] = np.arange(len(grupos))
+            grupo_da_linha = posicao[combinado]
+            contagem = contagem[grupos]
+        else:
+            grupos, grupo_da_linha = np.unique(combinado, return_inverse=True)
+            contagem = np.bincount(grupo_da_linha, minlength=len(grupos))
+
+        resultado = {}
+        resto = grupos
+        for chave, (_, valores), tamanho in reversed(list(zip(chaves, codigos, tamanhos))):
+            resto, cod = np.divmod(resto, tamanho)
+            nulo = cod == len(valores)
+            coluna = valores.take(np.where(nulo, 0, cod)) if len(valores) else pd.Index([None] * len(cod))
+            resultado[chave] = pd.Series(coluna).where(~nulo) if nulo.any() else pd.Series(coluna)
+        resultado = pd.DataFrame({c: resultado[c] for c in chaves})
+
+        for nome, col in medidas.items():
+            if col is None:
+                resultado[nome] = contagem
+                continue
+            valores = self._medida(col)
+            if selecao is not None:
+                valores = valores[selecao]
+            soma = np.bincount(grupo_da_linha, weights=valores, minlength=len(grupos))
+            resultado[nome] = np.rint(soma).astype("int64") if np.issubdtype(valores.dtype, np.integer) else soma
+        return resultado
+
+    def agregar_varios(self, medidas, agrupamentos, dropna=True):
+        """Vários agrupamentos sobre a mesma tabela (códigos fatorados compartilhados entre eles)."""
+        return [self.agregar(medidas, chaves, dropna) for chaves in agrupamentos]
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+
+from . import cliente_llm
+from .logica_IA import SCHEMA_DB_DESCRIPTION
+
+# Montagem do payload do Gemini dentro de um orçamento de tokens (conversa + instrução com o contexto)
+ORCAMENTO_TOKENS = int(os.getenv("LLM_ORCAMENTO_TOKENS", "8000"))       # entrada máxima estimada por chamada
+TURNOS_RECENTES = int(os.getenv("LLM_TURNOS_RECENTES", "6"))            # mensagens mais novas mantidas na íntegra
+CARACTERES_RESUMO = int(os.getenv("LLM_CARACTERES_RESUMO", "240"))      # por turno antigo no resumo
+# contexto em cache no Gemini (cachedContents): só vale acima do mínimo de tokens aceito pela API
+MIN_TOKENS_CACHE = int(os.getenv("LLM_MIN_TOKENS_CACHE", "1024"))
+CACHE_CONTEXTO_TTL = int(os.getenv("LLM_CACHE_CONTEXTO_TTL", "3600"))   # segundos
+CARACTERES_POR_TOKEN = 4  # estimativa sem tokenizador (português/JSON)
+
+FERRAMENTAS = [{"google_search": {}}]
+# lista de referências anexada às respostas na tela; não volta para o modelo
+MARCADOR_FONTES = "\n\n---\n**Referências:**\n"
+
+INSTRUCAO = """Você é um Analista de Marketing e CRM Estratégico sênior. Analise os dados fornecidos e responda em português, profissionalmente.
+Use busca Google para tendências. Mantenha respostas concisas e focadas em crescimento.
+Schema: {schema}
+Contexto: {contexto}"""
+
+
+def estimar_tokens(texto):
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def contexto_compacto(contexto_json):
+    """JSON do contexto sem indentação nem espaços (o indent=2 quase dobra o tamanho)."""
+    return json.dumps(json.loads(contexto_json), ensure_ascii=False, separators=(",", ":"))
+
+
+def instrucao_sistema(contexto_json):
+    return INSTRUCAO.format(schema=SCHEMA_DB_DESCRIPTION.strip(), contexto=contexto_compacto(contexto_json))
+
+
+def _texto(mensagem):
+    return str(mensagem["content"]).split(MARCADOR_FONTES)[0]
+
+
+def _resumir(antigos, orcamento):
+    """Resumo extrativo dos turnos antigos (início de cada mensagem); corta os mais velhos se não couber."""
+    linhas = []
+    for m in antigos:
+        texto = " ".join(_texto(m).split())
+        if len(texto) > CARACTERES_RESUMO:
+            texto = texto[:CARACTERES_RESUMO] + "…"
+        linhas.append(f"- {'Usuário' if m['role'] == 'user' else 'Assistente'}: {texto}")
+    while linhas and estimar_tokens("\n".join(linhas)) > orcamento:
+        linhas.pop(0)
+    return "Resumo da conversa anterior:\n" + "\n".join(linhas) if linhas else None
+
+
+def _conversa(historico, pergunta, orcamento):
+    """
+    Conteúdos da conversa dentro do orçamento: as mensagens recentes inteiras, as antigas num resumo
+    no início e, se nem o resumo couber, descartadas. A pergunta atual sempre vai.
+    """
+    restante = orcamento - estimar_tokens(pergunta)
+    recentes = []
+    for m in reversed(historico[-TURNOS_RECENTES:] if TURNOS_RECENTES > 0 else []):
+        custo = estimar_tokens(_texto(m))
+        if custo > restante:
+            break
+        recentes.insert(0, m)
+        restante -= custo
+    # a conversa enviada começa por uma mensagem do usuário
+    while recentes and recentes[0]["role"] != "user":
+        restante += estimar_tokens(_texto(recentes.pop(0)))
+    antigos = historico[:len(historico) - len(recentes)]
+
+    conteudos = [{"role": m["role"], "parts": [{"text": _texto(m)}]} for m in recentes]
+    conteudos.append({"role": "user", "parts": [{"text": pergunta}]})
+    resumo = _resumir(antigos, restante) if antigos else None
+    if resumo:
+        conteudos[0]["parts"].insert(0, {"text": resumo})
+    return conteudos, len(antigos)
+
+
+def _cache_contexto(estado, instrucao, api_key):
+    """
+    Nome do cachedContent com a instrução deste contexto, criado uma vez por sessão e contexto.
+
+    `estado` é um dict da sessão; contexto pequeno demais para a API (ou falha na criação) fica
+    marcado e segue inline, sem nova tentativa.
+    """
+    if estimar_tokens(instrucao) < MIN_TOKENS_CACHE:
+        return None
+    impressao = hashlib.sha256(instrucao.encode("utf-8")).hexdigest()
+    atual = estado.get("cache_contexto")
+    if atual and atual["impressao"] == impressao and (atual["nome"] is None or atual["expira"] > time.time() + 60):
+        return atual["nome"]
+    try:
+        nome = cliente_llm.criar_cache({
+            "systemInstruction": {"parts": [{"text": instrucao}]},
+            "tools": FERRAMENTAS,
+            "ttl": f"{CACHE_CONTEXTO_TTL}s",
+        }, api_key)
+    except cliente_llm.ErroLLM as erro:
+        print(f"Contexto enviado inline (cache do Gemini indisponível: {erro}).")
+        nome = None
+    estado["cache_contexto"] = {"impressao": impressao, "nome": nome, "expira": time.time() + CACHE_CONTEXTO_TTL}
+    return nome
+
+
+def montar_payload(pergunta, historico, contexto_json, api_key, estado):
+    """
+    Payload de generateContent para `pergunta`, com `historico` (mensagens anteriores) compactado.
+
+    O contexto vai uma vez por sessão como cachedContent quando a API aceita; senão segue inline
+    na instrução de sistema, em JSON compacto. Conversa e instrução somam até ORCAMENTO_TOKENS.
+    """
+    instrucao = instrucao_sistema(contexto_json)
+    conteudos, resumidos = _conversa(historico, pergunta, ORCAMENTO_TOKENS - estimar_tokens(instrucao))
+    if resumidos:
+        print(f"Conversa compactada: {resumidos} mensagens antigas resumidas ou descartadas.")
+
+    nome_cache = _cache_contexto(estado, instrucao, api_key)
+    if nome_cache is not None:
+        return {"contents": conteudos, "cachedContent": nome_cache}
+    return {
+        "contents": conteudos,
+        "tools": FERRAMENTAS,
+        "systemInstruction": {"parts": [{"text": instrucao}]},
+    }
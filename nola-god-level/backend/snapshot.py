@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import pyarrow as pa
+
+# Snapshot colunar (Arrow IPC) dos frames carregados, para o processo não começar do zero a cada restart
+VERSAO_FORMATO = 3  # 2: esquema compacto (esquema.py); 3: frames ordenados por data
+DIRETORIO_SNAPSHOT = os.getenv("DIRETORIO_SNAPSHOT", str(Path(__file__).resolve().parents[1] / ".snapshot"))
+
+
+def hash_esquema(sql):
+    """Muda quando a consulta ou o formato do snapshot mudam, invalidando arquivos antigos."""
+    return hashlib.sha256(f"{VERSAO_FORMATO}:{sql}".encode("utf-8")).hexdigest()[:16]
+
+
+def _caminhos(nome):
+    base = Path(DIRETORIO_SNAPSHOT)
+    return base / f"{nome}.arrow", base / f"{nome}.json"
+
+
+def salvar(nome, df, esquema, **meta):
+    """Grava o frame + metadados (marca d'água, hash do esquema) de forma atômica."""
+    if not DIRETORIO_SNAPSHOT:
+        return
+    arq_dados, arq_meta = _caminhos(nome)
+    arq_dados.parent.mkdir(parents=True, exist_ok=True)
+
+    inicio = time.time()
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = arq_dados.with_suffix(".arrow.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, tabela.schema) as writer:
+            writer.write_table(tabela)
+    os.replace(tmp, arq_dados)
+
+    meta = {"versao_formato": VERSAO_FORMATO, "esquema": esquema, "linhas": len(df), "salvo_em": time.time(), **meta}
+    tmp = arq_meta.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(meta, default=str), encoding="utf-8")
+    os.replace(tmp, arq_meta)
+    print(f"Snapshot salvo: {len(df)} linhas de {nome} em {time.time() - inicio:.1f}s.")
+
+
+def carregar(nome, esquema):
+    """Devolve (df, meta) do snapshot em disco, ou (None, None) se não existir ou estiver incompatível."""
+    if not DIRETORIO_SNAPSHOT:
+        return None, None
+    arq_dados, arq_meta = _caminhos(nome)
+    if not arq_dados.exists() or not arq_meta.exists():
+        return None, None
+
+    try:
+        meta = json.loads(arq_meta.read_text(encoding="utf-8"))
+        if meta.get("versao_formato") != VERSAO_FORMATO or meta.get("esquema") != esquema:
+            print(f"Snapshot de {nome} ignorado: esquema diferente.")
+            return None, None
+        inicio = time.time()
+        with pa.memory_map(str(arq_dados), "r") as fonte:
+            df = pa.ipc.open_file(fonte).read_all().to_pandas()
+    except (OSError, ValueError, pa.ArrowException) as erro:
+        print(f"Snapshot de {nome} ignorado: {erro}")
+        return None, None
+
+    print(f"Snapshot carregado: {len(df)} linhas de {nome} em {time.time() - inicio:.1f}s.")
+    return df, meta
@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .carregador_dados import _cache_itens, _cache_vendas
+from .esquema import dia_da_semana, dia_ordinal
+from .instrumentacao import registrar_frame, trecho
+
+# Com Copy-on-Write o frame entregue às páginas pode ser alterado à vontade sem corromper o cache
+# (no pandas >= 3.0 já é sempre assim)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+
+class _VisaoDerivada:
+    """Frame derivado de um cache incremental, reconstruído só quando a versão dos dados muda."""
+
+    def __init__(self, nome, derivar):
+        self.nome = nome
+        self.nome_frame = f"visao_{nome}"
+        self.derivar = derivar
+        self.df = None
+        self.versao = None
+        self.lock = threading.Lock()
+
+    def obter(self, cache):
+        with cache.lock:
+            base, versao = cache.df, cache.versao
+        with self.lock:
+            if self.versao != versao:
+                with trecho(f"visao:{self.nome}"):
+                    self.df = self.derivar(base)
+                registrar_frame(self.nome_frame, self.df)
+                self.versao = versao
+            # cópia rasa: O(colunas), compartilha os dados; qualquer escrita da página vira cópia só dela
+            return self.df.copy(deep=False)
+
+
+def _derivar_vendas(df):
+    df = df[df["sale_status_desc"] == "COMPLETED"].reset_index(drop=True)
+    return df.assign(
+        hora=df["created_at"].dt.hour.astype("int8"),
+        dia_semana=dia_da_semana(df["dia"]).astype("int8"),
+    )
+
+
+def _derivar_itens(df):
+    return df[df["sale_status_desc"] == "COMPLETED"].reset_index(drop=True)
+
+
+def _visao(cache, nome, derivar):
+    # uma visão por partição, guardada junto com o cache dela
+    return cache.derivado(nome, lambda: _VisaoDerivada(nome + cache.sufixo, derivar))
+
+
+def fatiar_periodo(df, data_inicio, data_fim, coluna_dia="dia"):
+    """
+    Recorta um frame ordenado por dia ao intervalo fechado [data_inicio, data_fim].
+
+    Duas buscas binárias na coluna de dias ordinais + fatia posicional: O(log n) e sem copiar dados,
+    em vez de duas máscaras booleanas sobre o frame inteiro. Os frames do carregador, as visões
+    e as células do cubo já vêm ordenados por dia.
+    """
+    dias = df[coluna_dia].to_numpy()
+    inicio, fim = np.searchsorted(dias, [dia_ordinal(data_inicio), dia_ordinal(data_fim) + 1])
+    return df.iloc[inicio:fim]
+
+
+def vendas_concluidas():
+    """Vendas COMPLETED com dia (ordinal), hora e dia_semana já calculados. Compartilhada entre sessões."""
+    cache = _cache_vendas()
+    cache.obter()
+    return _visao(cache, "vendas_concluidas", _derivar_vendas).obter(cache)
+
+
+def itens_concluidos():
+    """Itens de vendas COMPLETED. Compartilhada entre sessões."""
+    cache = _cache_itens()
+    cache.obter()
+    return _visao(cache, "itens_concluidos", _derivar_itens).obter(cache)
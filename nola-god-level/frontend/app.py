@@ -1,3 +1,4 @@
+import pandas as pd
 import streamlit as st
 from pathlib import Path
 import importlib.util
@@ -39,11 +40,129 @@ paginas = {
 }
 
 
+from backend import aquecimento, cache_resultados, instrumentacao
+from backend.carregador_dados import ESCOPO_PADRAO, estado_dados
+from backend.dimensoes import tabela, tabela_pronta
+
+
+# cada página é importada uma vez por processo; os reruns só chamam app() de novo
+@st.cache_resource
 def carregar(caminho: Path):
     spec = importlib.util.spec_from_file_location(f"paginas.{caminho.stem}", str(caminho))
     mod = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(mod)
-    return mod
+    return instrumentacao.instrumentar_pagina(mod, caminho.stem)
+
+
+def exibir_painel_desempenho(coleta):
+    # painel de administração: só com PAINEL_DESEMPENHO=1 no .env
+    trechos, consultas, frames = instrumentacao.resumo()
+    with st.sidebar.expander("⏱️ Desempenho"):
+        st.caption("Última execução da página")
+        st.dataframe(pd.DataFrame(
+            [{"Trecho": "· " * p + nome, "ms": round(s * 1000, 1)} for p, nome, s in coleta]
+        ), hide_index=True)
+        st.caption("Acumulado do processo")
+        st.dataframe(pd.DataFrame(
+            [{"Trecho": nome, "Chamadas": n, "Total (s)": round(t, 3), "Média (ms)": round(t / n * 1000, 1),
+              "Máx (ms)": round(m * 1000, 1)} for nome, (n, t, m) in trechos.items()]
+        ).sort_values("Total (s)", ascending=False), hide_index=True)
+        if consultas:
+            st.caption("Consultas SQL")
+            st.dataframe(pd.DataFrame(
+                [{"Consulta": nome, "Chamadas": n, "Total (s)": round(t, 3), "Máx (s)": round(m, 3)}
+                 for nome, (n, t, m) in consultas.items()]
+            ), hide_index=True)
+        if frames:
+            st.caption("Frames residentes")
+            st.dataframe(pd.DataFrame(
+                [{"Frame": nome, "Linhas": linhas, "MB": round(tamanho / 1024 ** 2, 1)}
+                 for nome, (linhas, tamanho) in frames.items()]
+            ), hide_index=True)
+        cache = cache_resultados.estatisticas()
+        if cache["paginas"]:
+            st.caption(f"Cache de resultados: {cache['entradas']} entradas, {cache['bytes'] / 1024 ** 2:.1f} MB")
+            st.dataframe(pd.DataFrame(
+                [{"Página": pagina, "Acertos": acertos, "Erros": erros,
+                  "Taxa (%)": round(100 * acertos / (acertos + erros), 1)}
+                 for pagina, (acertos, erros) in cache["paginas"].items()]
+            ), hide_index=True)
+        st.download_button("Métricas (Prometheus)", instrumentacao.texto_prometheus(),
+                           file_name="metrics.txt", mime="text/plain")
+
+
+def _idade(segundos):
+    if segundos < 90:
+        return f"{segundos:.0f} s"
+    if segundos < 90 * 60:
+        return f"{segundos / 60:.0f} min"
+    return f"{segundos / 3600:.1f} h"
+
+
+def exibir_aquecimento():
+    # enquanto o aquecimento da partida não termina, a página espera a carga em andamento
+    if aquecimento.aquecimento_pronto():
+        return
+    etapas = aquecimento.estado_aquecimento()
+    prontas = sum(etapa["estado"] == "pronto" for etapa in etapas.values())
+    em_andamento = ", ".join(nome for nome, etapa in etapas.items() if etapa["estado"] == "carregando")
+    st.sidebar.caption(f"⏳ Preparando dados ({prontas}/{len(etapas)}): {em_andamento or 'na fila'}")
+
+
+def selecionar_escopo():
+    # só a partição escolhida (sub-marca e, opcionalmente, estado) é carregada para a sessão
+    lojas = tabela_pronta("lojas")
+    if lojas is None and aquecimento.aquecimento_pronto():
+        lojas = tabela("lojas")  # aquecimento desligado ou já encerrado: carrega aqui mesmo
+    if lojas is None:
+        return _escopo_provisorio()
+    sub_marcas = lojas.dropna(subset=["sub_brand_id"]).drop_duplicates("sub_brand_id")
+    nomes = dict(zip(sub_marcas["sub_brand_id"].astype(int), sub_marcas["sub_brand_name"]))
+    padrao_sub_brand, padrao_estado = ESCOPO_PADRAO
+
+    st.sidebar.subheader("Escopo dos Dados")
+    opcoes = [None] + sorted(nomes)
+    sub_brand = st.sidebar.selectbox(
+        "Sub-marca:", options=opcoes,
+        index=opcoes.index(padrao_sub_brand) if padrao_sub_brand in opcoes else 0,
+        format_func=lambda v: "Todas as Sub-marcas" if v is None else f"{nomes[v]} (ID {v})",
+    )
+    if sub_brand is not None:
+        lojas = lojas[lojas["sub_brand_id"] == sub_brand]
+    estados = [None] + sorted(lojas["state"].dropna().unique())
+    estado = st.sidebar.selectbox(
+        "Estado:", options=estados,
+        index=estados.index(padrao_estado) if padrao_estado in estados else 0,
+        format_func=lambda v: "Todos os Estados" if v is None else v,
+    )
+    st.session_state.particao_dados = (sub_brand, estado)
+    st.sidebar.markdown("---")
+    return True
+
+
+def _escopo_provisorio():
+    # lojas ainda no aquecimento: sem nomes para o seletor, a sessão fica no escopo padrão (o que está
+    # sendo aquecido) e o seletor aparece quando a dimensão chegar
+    st.session_state.setdefault("particao_dados", ESCOPO_PADRAO)
+    sub_brand, estado = st.session_state.particao_dados
+    st.sidebar.subheader("Escopo dos Dados")
+    escopo = "Todas as Sub-marcas" if sub_brand is None else f"Sub-marca ID {sub_brand}"
+    st.sidebar.caption(f"⏳ {escopo}, {estado or 'Todos os Estados'} — carregando lojas para escolher o escopo…")
+    st.sidebar.markdown("---")
+    return False
+
+
+def exibir_estado_dados():
+    # os dados são servidos na hora e atualizados em segundo plano: mostra a idade de cada conjunto
+    for estado in estado_dados():
+        if estado["atualizando"]:
+            situacao = "🔄 atualizando…"
+        elif estado["ultimo_erro"]:
+            situacao = "⚠️ falha na última atualização"
+        else:
+            situacao = "🟢"
+        st.sidebar.caption(f"{situacao} {estado['nome']}: atualizado há {_idade(estado['idade_segundos'])}",
+                           help=estado["ultimo_erro"])
 
 
 def main():
@@ -58,8 +177,18 @@ def main():
     sel = st.sidebar.radio("Escolha a página:", labels, label_visibility="collapsed")
     mapa = {m[0]: m[1] for m in menu}
     chave = mapa[sel]
+    # o aquecimento começa antes do seletor de escopo, que depende da dimensão de lojas
+    aquecimento.iniciar_aquecimento()
+    escopo_pronto = selecionar_escopo()
+    exibir_aquecimento()
     mod = carregar(paginas[chave])
-    mod.app()
+    with instrumentacao.execucao(paginas[chave].stem) as coleta:
+        mod.app()
+    exibir_estado_dados()
+    if instrumentacao.PAINEL_DESEMPENHO:
+        exibir_painel_desempenho(coleta)
+    if not escopo_pronto and tabela_pronta("lojas") is not None:
+        st.rerun()  # lojas chegou durante a página: mostra o seletor de escopo
     
 
 
@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from backend.carregador_dados import dados_vendas_cache
+from backend.agregacao import agregar, limites_periodo, FILTRO_CONCLUIDAS
+from backend.graficos import GRANULARIDADES, OPCOES_GRANULARIDADE, grafico_linha, serie_temporal
 
 # Mapeamentos
 MAPA_NOMES_CANAIS = {
@@ -14,16 +15,9 @@ MAPA_CORES_CANAIS = {
 }
 
 
-def carregar_dados():
-    df = dados_vendas_cache()
-    df = df.copy()
-    df.loc[:, 'sale_date'] = df['created_at'].dt.date
-    return df[df['sale_status_desc'] == 'COMPLETED'].copy()
-
 #filtro de data
-def aplicar_filtro_data(df):
-    data_minima = df['sale_date'].min()
-    data_maxima = df['sale_date'].max()
+def aplicar_filtro_data():
+    data_minima, data_maxima = limites_periodo()
     
     periodo = st.sidebar.date_input(
         "Selecione o Período:",
@@ -33,20 +27,20 @@ def aplicar_filtro_data(df):
     )
     
     if len(periodo) == 2:
-        data_inicio, data_fim = periodo
-        df_filtrado = df[(df['sale_date'] >= data_inicio) & (df['sale_date'] <= data_fim)].copy()
-    else:
-        df_filtrado = df.copy()
-    
-    return df_filtrado
+        return tuple(periodo)
+    return data_minima, data_maxima
+
+
+#granularidade das tendências (automática = pelo tamanho do período)
+def aplicar_filtro_granularidade():
+    escolha = st.sidebar.selectbox("Granularidade das Tendências:", options=list(OPCOES_GRANULARIDADE))
+    return OPCOES_GRANULARIDADE[escolha]
 
 
-def calcular_kpis(df):
-    faturamento = df['total_amount'].sum()
-    vendas = len(df)
-    ticket_medio = faturamento / vendas 
+def calcular_kpis(periodo):
+    df = agregar(['faturamento', 'vendas', 'ticket_medio'], periodo=periodo, filtros=FILTRO_CONCLUIDAS)
     
-    return {'faturamento': faturamento, 'vendas': vendas, 'ticket_medio': ticket_medio}
+    return {'faturamento': df.at[0, 'faturamento'], 'vendas': int(df.at[0, 'vendas']), 'ticket_medio': df.at[0, 'ticket_medio']}
 
 
 def exibir_kpis(kpis):
@@ -58,24 +52,23 @@ def exibir_kpis(kpis):
     with col3:
         st.metric("Ticket Médio", f"R$ {kpis['ticket_medio']:,.2f}")
 
-# faturamento diário
-def exibir_tendencia_faturamento(df):
-    st.subheader("Faturamento Diário ao Longo do Tempo")
+# faturamento ao longo do tempo
+def exibir_tendencia_faturamento(periodo, granularidade=None):
+    df_tendencia, granularidade = serie_temporal(['faturamento'], periodo, FILTRO_CONCLUIDAS, granularidade)
+    df_tendencia = df_tendencia.rename(columns={'faturamento': 'Faturamento'})
+    st.subheader(f"Faturamento ao Longo do Tempo ({GRANULARIDADES[granularidade]})")
     
-    df_tendencia = df.groupby('sale_date')['total_amount'].sum().reset_index(name='Faturamento')
-    
-    fig = px.line(df_tendencia, x='sale_date', y='Faturamento',
-                  title='Tendência Diária da Rede', template='plotly_white')
+    fig = grafico_linha(df_tendencia, x='data', y='Faturamento',
+                        title='Tendência da Rede', template='plotly_white')
     fig.update_yaxes(tickprefix='R$ ')
     st.plotly_chart(fig, use_container_width=True)
 
 #horário de pico
-def exibir_horario_pico(df):
+def exibir_horario_pico(periodo):
     st.subheader("Horário de Pico de Vendas (Análise Operacional)")
 
-    df_local = df.copy()
-    df_local.loc[:, 'hora_venda'] = df_local['created_at'].dt.hour
-    df_por_hora = df_local.groupby('hora_venda')['total_amount'].count().reset_index(name='Número de Vendas')
+    df_por_hora = agregar(['vendas'], ['hora'], periodo, FILTRO_CONCLUIDAS).rename(
+        columns={'hora': 'hora_venda', 'vendas': 'Número de Vendas'})
     
     fig = px.bar(df_por_hora, x='hora_venda', y='Número de Vendas',
                  title='Distribuição de Vendas por Hora do Dia', template='plotly_white')
@@ -83,7 +76,7 @@ def exibir_horario_pico(df):
     st.plotly_chart(fig, use_container_width=True)
 
 #distribuição por canal e estado
-def exibir_distribuicao_canal_estado(df):
+def exibir_distribuicao_canal_estado(periodo):
     st.subheader("Distribuição de Receita por Canal e Localidades")
     
     col_canais, col_estados = st.columns(2)
@@ -92,7 +85,8 @@ def exibir_distribuicao_canal_estado(df):
         st.markdown("##### Faturamento por Canal")
     
         # Agrupando por canal e somando o faturamento
-        faturamento_canal = df.groupby('channel_name')['total_amount'].sum().reset_index()
+        faturamento_canal = agregar(['faturamento'], ['channel_name'], periodo, FILTRO_CONCLUIDAS).rename(
+            columns={'faturamento': 'total_amount'})
         
         # Gráfico de pizza para a proporção do faturamento
         fig = px.pie(faturamento_canal, values='total_amount', names='channel_name',
@@ -105,7 +99,7 @@ def exibir_distribuicao_canal_estado(df):
     
     with col_estados:
         st.markdown("##### Faturamento por Estado (Top 5 + Outros)")
-        df_estados = df.dropna(subset=['state']).groupby('state')['total_amount'].sum().reset_index(name='Faturamento')
+        df_estados = agregar(['faturamento'], ['state'], periodo, FILTRO_CONCLUIDAS).rename(columns={'faturamento': 'Faturamento'})
         df_estados.rename(columns={'state': 'Estado'}, inplace=True) 
         
         df_top5 = df_estados.nlargest(5, 'Faturamento')
@@ -126,18 +120,14 @@ def exibir_distribuicao_canal_estado(df):
 
 
 # Função para exibir tendência do ticket médio
-def exibir_ticket_medio(df):
-    st.subheader("Tendência Diária do Ticket Médio")
-    
-    df_ticket = df.groupby('sale_date').agg(
-        Total_Faturamento=('total_amount', 'sum'),
-        Total_Vendas=('sale_date', 'size')
-    ).reset_index()
-    df_ticket['Ticket Médio'] = df_ticket['Total_Faturamento'] / df_ticket['Total_Vendas']
-    
-    fig = px.line(df_ticket, x='sale_date', y='Ticket Médio',
-                  title='Evolução do Ticket Médio no Período', template='plotly_white',
-                  line_shape='spline', color_discrete_sequence=['#FF7F0E'])
+def exibir_ticket_medio(periodo, granularidade=None):
+    df_ticket, granularidade = serie_temporal(['ticket_medio'], periodo, FILTRO_CONCLUIDAS, granularidade)
+    df_ticket = df_ticket.rename(columns={'ticket_medio': 'Ticket Médio'})
+    st.subheader(f"Tendência do Ticket Médio ({GRANULARIDADES[granularidade]})")
+    
+    fig = grafico_linha(df_ticket, x='data', y='Ticket Médio',
+                        title='Evolução do Ticket Médio no Período', template='plotly_white',
+                        line_shape='spline', color_discrete_sequence=['#FF7F0E'])
     fig.update_yaxes(tickprefix='R$ ')
     st.plotly_chart(fig, use_container_width=True)
 
@@ -145,20 +135,20 @@ def exibir_ticket_medio(df):
 def app():
     st.sidebar.header("Filtros de Análise")
     
-    df = carregar_dados()
-    df_final = aplicar_filtro_data(df)
+    periodo = aplicar_filtro_data()
+    granularidade = aplicar_filtro_granularidade()
     
     st.title("Performance Global da Marca")
     st.markdown("Análise de KPIs e Tendências de Vendas para toda a rede.")
     
-    kpis = calcular_kpis(df_final)
+    kpis = calcular_kpis(periodo)
     exibir_kpis(kpis)
     st.markdown("---")
     
-    exibir_tendencia_faturamento(df_final)
-    exibir_horario_pico(df_final)
-    exibir_distribuicao_canal_estado(df_final)
-    exibir_ticket_medio(df_final)
+    exibir_tendencia_faturamento(periodo, granularidade)
+    exibir_horario_pico(periodo)
+    exibir_distribuicao_canal_estado(periodo)
+    exibir_ticket_medio(periodo, granularidade)
     st.markdown("---")
 
 # Executa
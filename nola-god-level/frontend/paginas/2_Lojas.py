@@ -3,7 +3,11 @@ import pandas as pd
 import plotly.express as px
 import numpy as np
 import plotly.graph_objects as go
-from backend.carregador_dados import dados_vendas_cache
+from backend.agregacao import agregar, limites_periodo, versao_dados, FILTRO_CONCLUIDAS
+from backend.cache_resultados import memoizar
+from backend.carregador_dados import escopo_dados, particao_atual
+from backend.dimensoes import rotular
+from backend.graficos import GRANULARIDADES, grafico_linha, serie_temporal
 
 # Mapeamento
 MAPA_NOMES_CANAIS = {
@@ -19,16 +23,8 @@ MAPA_DIAS_SEMANA = {
     3: 'Quinta', 4: 'Sexta', 5: 'Sábado', 6: 'Domingo'
 }
 
-def carregar_dados():
-    df = dados_vendas_cache()
-    df = df.copy()
-    df.loc[:, 'sale_date'] = df['created_at'].dt.date
-    return df[df['sale_status_desc'] == 'COMPLETED'].copy()
-
-
-def aplicar_filtro_data(df):
-    data_minima = df['sale_date'].min()
-    data_maxima = df['sale_date'].max()
+def aplicar_filtro_data():
+    data_minima, data_maxima = limites_periodo()
     
     periodo = st.sidebar.date_input(
         "Selecione o Período:",
@@ -39,65 +35,59 @@ def aplicar_filtro_data(df):
     
     if len(periodo) == 2:
         data_inicio, data_fim = periodo
-        df_filtrado = df[(df['sale_date'] >= data_inicio) & (df['sale_date'] <= data_fim)].copy()
     else:
-        df_filtrado = df.copy()
         data_inicio, data_fim = data_minima, data_maxima
     
-    return df_filtrado, data_inicio, data_fim
+    return data_inicio, data_fim
 
-# filtros de modo, estado e loja
-def aplicar_filtros_unidade(df):
+# modo de análise
+def selecionar_modo():
     st.sidebar.header("Modo de Análise")
     modo = st.sidebar.radio(
         "Selecione o foco da análise:",
         options=["Comparativo (Todas as Lojas)", "Unidade Única (Loja Detalhada)"],
         index=0
     )
-    
-    estado_sel = 'Todos os Estados'
-    loja_sel = 'Todas as Lojas'
+    return modo
+
+
+# filtros de estado e loja (modo unidade única)
+def aplicar_filtros_unidade(periodo):
+    filtros = dict(FILTRO_CONCLUIDAS)
     titulo = "Comparativo de Performance e Ranking entre Unidades"
     
-    if modo == "Unidade Única (Loja Detalhada)":
-        st.sidebar.markdown("---")
-        st.sidebar.subheader("Filtrar Unidade")
-        
-        estados = ['Todos os Estados'] + sorted(df['state'].dropna().unique())
-        estado_sel = st.sidebar.selectbox("1. Filtrar por Estado:", options=estados)
-        
-        if estado_sel != 'Todos os Estados':
-            df = df[df['state'] == estado_sel].copy()  # <-- CORREÇÃO: Filtra o DataFrame pelo estado
-            lojas = df['store_id'].unique()
-            titulo = f"Performance do Estado: {estado_sel}"
-        else:
-            lojas = df['store_id'].unique()
-        
-        loja_sel = st.sidebar.selectbox("2. Selecione a Loja (ID):", options=['Selecione a Loja'] + sorted(lojas))
-        
-        if loja_sel != 'Selecione a Loja':
-            df = df[df['store_id'] == loja_sel].copy()
-            titulo = f"Performance Detalhada da Loja: ID {loja_sel}"
-    
-    return df, titulo
-
-
-def calcular_kpis(df):
-  
-    faturamento = df['total_amount'].sum()
-    vendas = len(df)
-    ticket_medio = faturamento / vendas 
-    
-    return {'faturamento': faturamento, 'vendas': vendas, 'ticket_medio': ticket_medio}
-
-
-def preparar_ranking_lojas(df):
-    df_ranking = df.groupby(['store_id', 'store_name']).agg(
-        Faturamento=('total_amount', 'sum'),
-        Vendas=('store_id', 'size')
-    ).reset_index()
-    
-    df_ranking['Loja'] = df_ranking['store_name'].fillna('Loja') + ' (ID ' + df_ranking['store_id'].astype(str) + ')'
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Filtrar Unidade")
+    
+    estados = ['Todos os Estados'] + sorted(agregar(['vendas'], ['state'], periodo, filtros)['state'])
+    estado_sel = st.sidebar.selectbox("1. Filtrar por Estado:", options=estados)
+    
+    if estado_sel != 'Todos os Estados':
+        filtros['state'] = estado_sel  # <-- CORREÇÃO: Filtra pelo estado
+        titulo = f"Performance do Estado: {estado_sel}"
+    lojas = agregar(['vendas'], ['store_id'], periodo, filtros)['store_id'].tolist()
+    
+    loja_sel = st.sidebar.selectbox("2. Selecione a Loja (ID):", options=['Selecione a Loja'] + sorted(lojas))
+    
+    if loja_sel != 'Selecione a Loja':
+        filtros['store_id'] = loja_sel
+        titulo = f"Performance Detalhada da Loja: ID {loja_sel}"
+    
+    return filtros, titulo
+
+
+@memoizar("2_Lojas", versao_dados)
+def calcular_kpis(periodo, filtros):
+    df = agregar(['faturamento', 'vendas', 'ticket_medio'], periodo=periodo, filtros=filtros)
+    
+    return {'faturamento': df.at[0, 'faturamento'], 'vendas': int(df.at[0, 'vendas']), 'ticket_medio': df.at[0, 'ticket_medio']}
+
+
+@memoizar("2_Lojas", versao_dados)
+def preparar_ranking_lojas(periodo, filtros):
+    df_ranking = agregar(['faturamento', 'vendas'], ['store_id'], periodo, filtros, incluir_nulos=True)
+    df_ranking = df_ranking.dropna(subset=['store_id']).rename(columns={'faturamento': 'Faturamento', 'vendas': 'Vendas'})
+    
     df_ranking['Ticket Médio'] = df_ranking['Faturamento'] / df_ranking['Vendas']
     df_ranking = df_ranking.sort_values('Faturamento', ascending=False).reset_index(drop=True)
     df_ranking['Rank'] = range(1, len(df_ranking) + 1)
@@ -105,6 +95,13 @@ def preparar_ranking_lojas(df):
     return df_ranking
 
 
+# nome da loja só para as linhas que vão para o gráfico
+def rotular_lojas(df):
+    df = rotular(df, ['store_name'])
+    df['Loja'] = df['store_name'].fillna('Loja') + ' (ID ' + df['store_id'].astype(str) + ')'
+    return df
+
+
 def exibir_kpis(kpis):
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -117,7 +114,7 @@ def exibir_kpis(kpis):
 #(top/bottom 10)
 def exibir_ranking_lojas(df_ranking):
     st.header("Top 10 Melhores Lojas (Faturamento)")
-    df_top10 = df_ranking.head(10).sort_values('Faturamento', ascending=True)
+    df_top10 = rotular_lojas(df_ranking.head(10)).sort_values('Faturamento', ascending=True)
     
     fig_top = px.bar(df_top10, x='Faturamento', y='Loja', orientation='h',
                      title='Faturamento das Top 10 Melhores Lojas', color_discrete_sequence=['#1F77B4'])
@@ -126,7 +123,7 @@ def exibir_ranking_lojas(df_ranking):
     
     st.markdown("---")
     st.header("Top 10 Piores Lojas (Faturamento)")
-    df_bottom10 = df_ranking.nsmallest(10, 'Faturamento').sort_values('Faturamento', ascending=False)
+    df_bottom10 = rotular_lojas(df_ranking.nsmallest(10, 'Faturamento')).sort_values('Faturamento', ascending=False)
     
     fig_bottom = px.bar(df_bottom10, x='Faturamento', y='Loja', orientation='h',
                         title='Faturamento das 10 Piores Lojas', color_discrete_sequence=["#b92020"])
@@ -134,27 +131,23 @@ def exibir_ranking_lojas(df_ranking):
     st.plotly_chart(fig_bottom, use_container_width=True)
 
 #análise detalhada de unidade
-def exibir_analise_unidade(df):
-    df = df.copy()
+def exibir_analise_unidade(periodo, filtros):
     st.header("KPIs Principais")
     
     
-    st.subheader("Evolução Diária do Faturamento e do Ticket Médio")
+    df_serie, granularidade = serie_temporal(['faturamento', 'ticket_medio'], periodo, filtros)
+    st.subheader(f"Evolução do Faturamento e do Ticket Médio ({GRANULARIDADES[granularidade]})")
     
-    df_fat = df.groupby('sale_date')['total_amount'].sum().reset_index(name='Faturamento')
-    fig_fat = px.line(df_fat, x='sale_date', y='Faturamento', title='Tendência de Faturamento',
-                      line_shape='spline', color_discrete_sequence=['#4A148C'])
+    df_fat = df_serie.rename(columns={'faturamento': 'Faturamento'})
+    fig_fat = grafico_linha(df_fat, x='data', y='Faturamento', title='Tendência de Faturamento',
+                            line_shape='spline', color_discrete_sequence=['#4A148C'])
     fig_fat.update_yaxes(tickprefix='R$ ')
     st.plotly_chart(fig_fat, use_container_width=True)
     
-    df_ticket = df.groupby('sale_date').agg(
-        Total_Faturamento=('total_amount', 'sum'),
-        Total_Vendas=('sale_date', 'size')
-    ).reset_index()
-    df_ticket['Ticket Médio'] = df_ticket['Total_Faturamento'] / df_ticket['Total_Vendas']
+    df_ticket = df_serie.rename(columns={'ticket_medio': 'Ticket Médio'})
     
-    fig_ticket = px.line(df_ticket, x='sale_date', y='Ticket Médio', title='Evolução do Ticket Médio',
-                         line_shape='spline', color_discrete_sequence=['#FF7F0E'])
+    fig_ticket = grafico_linha(df_ticket, x='data', y='Ticket Médio', title='Evolução do Ticket Médio',
+                               line_shape='spline', color_discrete_sequence=['#FF7F0E'])
     fig_ticket.update_yaxes(tickprefix='R$ ')
     st.plotly_chart(fig_ticket, use_container_width=True)
     
@@ -162,7 +155,7 @@ def exibir_analise_unidade(df):
     
     #canais
     st.subheader("Distribuição do Mix de Vendas")
-    df_canais = df.groupby('channel_name')['total_amount'].sum().reset_index(name='Faturamento')
+    df_canais = agregar(['faturamento'], ['channel_name'], periodo, filtros).rename(columns={'faturamento': 'Faturamento'})
     
     fig_canais = px.pie(df_canais, names='channel_name', values='Faturamento',
                         title='Proporção de Faturamento por Canal', hole=0.5,
@@ -174,10 +167,8 @@ def exibir_analise_unidade(df):
     
     # dia da semana
     st.subheader("Sazonalidade: Faturamento por Dia da Semana")
-    df.loc[:, 'day_of_week'] = df['created_at'].dt.dayofweek
-    df.loc[:, 'Dia da Semana'] = df['day_of_week'].map(MAPA_DIAS_SEMANA)
-    
-    df_sazonal = df.groupby('Dia da Semana')['total_amount'].sum().reset_index(name='Faturamento')
+    df_sazonal = agregar(['faturamento'], ['dia_semana'], periodo, filtros).rename(columns={'faturamento': 'Faturamento'})
+    df_sazonal['Dia da Semana'] = df_sazonal['dia_semana'].map(MAPA_DIAS_SEMANA)
     df_sazonal['Dia da Semana'] = pd.Categorical(df_sazonal['Dia da Semana'], categories=list(MAPA_DIAS_SEMANA.values()), ordered=True)
     df_sazonal = df_sazonal.sort_values('Dia da Semana')
     
@@ -187,26 +178,47 @@ def exibir_analise_unidade(df):
     st.plotly_chart(fig_dias, use_container_width=True)
 
 
-def app():
-    st.sidebar.header("Filtros de Análise")
-    
-    df = carregar_dados()
-    df_filtrado_data, _, _ = aplicar_filtro_data(df)
-    df_final, titulo_analise = aplicar_filtros_unidade(df_filtrado_data)
-    
-    st.sidebar.markdown("---")
-    st.title("Análise de Performance por Unidade")
+def exibir_pagina(periodo, filtros, titulo_analise):
     st.subheader(titulo_analise)
     
-    kpis = calcular_kpis(df_final)
+    kpis = calcular_kpis(periodo, filtros)
     exibir_kpis(kpis)
     st.markdown("---")
     
     if "Comparativo" in titulo_analise or "Rede Total" in titulo_analise:
-        df_ranking = preparar_ranking_lojas(df_final)
+        df_ranking = preparar_ranking_lojas(periodo, filtros)
         exibir_ranking_lojas(df_ranking)
     else:
-        exibir_analise_unidade(df_final)
+        exibir_analise_unidade(periodo, filtros)
+
+
+# trocar estado/loja reexecuta só este trecho (filtros + análise), não a página inteira
+@st.fragment
+def exibir_unidade(periodo):
+    filtros, titulo_analise = aplicar_filtros_unidade(periodo)
+    st.sidebar.markdown("---")
+    if 'state' not in filtros:
+        exibir_pagina(periodo, filtros, titulo_analise)
+        return
+    # estado escolhido: a análise usa a partição do estado, carregada só se nenhuma maior já estiver em memória
+    sub_brand, _ = particao_atual()
+    with escopo_dados((sub_brand, filtros['state']), reaproveitar=True):
+        exibir_pagina(periodo, filtros, titulo_analise)
+
+
+def app():
+    st.sidebar.header("Filtros de Análise")
+    
+    periodo = aplicar_filtro_data()
+    modo = selecionar_modo()
+    
+    st.title("Análise de Performance por Unidade")
+    
+    if modo == "Unidade Única (Loja Detalhada)":
+        exibir_unidade(periodo)
+    else:
+        st.sidebar.markdown("---")
+        exibir_pagina(periodo, dict(FILTRO_CONCLUIDAS), "Comparativo de Performance e Ranking entre Unidades")
 
 
 if __name__ == "__main__":
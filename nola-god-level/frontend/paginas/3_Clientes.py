@@ -2,20 +2,23 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
-from backend.carregador_dados import dados_vendas_cache
+from backend.agregacao import agregar, limites_periodo, versao_dados, FILTRO_CONCLUIDAS
+from backend.cache_resultados import memoizar
+from backend.clientes import primeira_compra
+from backend.crm import analise_rfm, matriz_coortes
+from backend.dimensoes import rotular
 
 
 
-def carregar_dados():
-    df = dados_vendas_cache()
-    df = df.copy()
-    df.loc[:, 'sale_date'] = df['created_at'].dt.date
-    return df[df['sale_status_desc'] == 'COMPLETED'].copy()
+def carregar_dados(data_inicio, data_fim):
+    # uma linha por (cliente, dia ordinal): pedidos sem cadastro ficam agrupados em customer_id nulo
+    df = agregar(['faturamento', 'vendas'], ['customer_id', 'dia'], (data_inicio, data_fim),
+                 FILTRO_CONCLUIDAS, incluir_nulos=True)
+    return df.rename(columns={'faturamento': 'total_amount'})
 
 
-def aplicar_filtros(df):
-    data_minima = df['sale_date'].min()
-    data_maxima = df['sale_date'].max()
+def aplicar_filtros():
+    data_minima, data_maxima = limites_periodo()
     
     periodo = st.sidebar.date_input(
         "Selecione o Período:",
@@ -26,25 +29,16 @@ def aplicar_filtros(df):
     
     if len(periodo) == 2:
         data_inicio, data_fim = periodo
-        df_filtrado = df[(df['sale_date'] >= data_inicio) & (df['sale_date'] <= data_fim)].copy()
     else:
-        df_filtrado = df.copy()
         data_inicio, data_fim = data_minima, data_maxima
     
-    return df_filtrado, data_inicio, data_fim
+    return data_inicio, data_fim
 
 # Função para calcular métricas de clientes
 def calcular_metricas_clientes(df, data_inicio, data_fim):
-    # primeira compra global
-    df_primeira_compra = (
-        df.dropna(subset=['customer_id'])
-        .groupby('customer_id')['sale_date']
-        .min()
-        .reset_index(name='primeira_compra_global')
-    )
-    
-  
-    df = pd.merge(df, df_primeira_compra, on='customer_id', how='left')
+    # primeira compra global (todas as vendas concluídas, não só o período): consulta vetorizada na tabela de
+    # clientes, comparada como dia ordinal (int32) sem converter nenhuma linha em data
+    primeira_compra_global = primeira_compra(df['customer_id'])
     df['Status_Cadastro'] = np.where(
         df['customer_id'].notna(),
         'Com Cadastro (Identificado)',
@@ -52,12 +46,7 @@ def calcular_metricas_clientes(df, data_inicio, data_fim):
     )
     
     is_identified = df['customer_id'].notna()
-    is_new = (
-        (df['primeira_compra_global'] >= data_inicio) &
-        (df['primeira_compra_global'] <= data_fim) &
-        is_identified
-    )
-    is_first_purchase = df['sale_date'] == df['primeira_compra_global']
+    is_first_purchase = df['dia'].to_numpy() == primeira_compra_global
     
     df['Tipo_Cliente'] = np.select(
         [is_identified & is_first_purchase, is_identified],
@@ -69,7 +58,7 @@ def calcular_metricas_clientes(df, data_inicio, data_fim):
 
 # Função para calcular KPIs
 def calcular_kpis(df):
-    total_transacoes = len(df)
+    total_transacoes = df['vendas'].sum()
     total_faturamento = df['total_amount'].sum()
     aov = total_faturamento / total_transacoes
     
@@ -77,12 +66,12 @@ def calcular_kpis(df):
     clientes_unicos = df_identificados['customer_id'].nunique()
     
     
-    pedidos_por_cliente = df_identificados.groupby('customer_id').size()
+    pedidos_por_cliente = df_identificados.groupby('customer_id')['vendas'].sum()
     clientes_recorrentes = (pedidos_por_cliente > 1).sum()
     taxa_recompra = (clientes_recorrentes / clientes_unicos) * 100
    
     
-    vendas_sem_cadastro = len(df[df['Status_Cadastro'] == 'Sem Cadastro (Não Identificado)'])
+    vendas_sem_cadastro = df.loc[df['Status_Cadastro'] == 'Sem Cadastro (Não Identificado)', 'vendas'].sum()
     
     return {
         'total_transacoes': total_transacoes,
@@ -91,10 +80,17 @@ def calcular_kpis(df):
         'clientes_unicos': clientes_unicos,
         'taxa_recompra': taxa_recompra,
         'vendas_sem_cadastro': vendas_sem_cadastro,
-        'df_identificados': df_identificados
+        'vendas_com_cadastro': df_identificados['vendas'].sum()
     }
 
 
+# frame por (cliente, dia) com as métricas + KPIs do período, guardados por período e versão dos dados
+@memoizar("3_Clientes", versao_dados)
+def preparar_clientes(data_inicio, data_fim):
+    df_com_metricas = calcular_metricas_clientes(carregar_dados(data_inicio, data_fim), data_inicio, data_fim)
+    return df_com_metricas, calcular_kpis(df_com_metricas)
+
+
 def exibir_kpis_e_distribuicao(df, kpis):
     st.header("1. KPIs Estratégicos")
     
@@ -107,13 +103,13 @@ def exibir_kpis_e_distribuicao(df, kpis):
         st.metric("Valor Médio de Transação (AOV)", f"R$ {kpis['aov']:.2f}")
     
     #cadastros
-    df_cadastro = df.groupby('Status_Cadastro').size().reset_index(name='Pedidos')
+    df_cadastro = df.groupby('Status_Cadastro')['vendas'].sum().reset_index(name='Pedidos')
     
     col_kpis, col_grafico = st.columns([1, 1])
     with col_kpis:
-        st.metric("Vendas Com Cadastro", f"{len(kpis['df_identificados']):,}")
+        st.metric("Vendas Com Cadastro", f"{kpis['vendas_com_cadastro']:,}")
         st.metric("Vendas Sem Cadastro", f"{kpis['vendas_sem_cadastro']:,}")
-        percentual = (len(kpis['df_identificados']) / kpis['total_transacoes']) * 100 if kpis['total_transacoes'] > 0 else 0
+        percentual = (kpis['vendas_com_cadastro'] / kpis['total_transacoes']) * 100 if kpis['total_transacoes'] > 0 else 0
         st.metric("% Vendas Identificadas", f"{percentual:.1f}%")
     
     with col_grafico:
@@ -132,7 +128,7 @@ def exibir_analise_retencao(df):
     df_retencao = df[df['Tipo_Cliente'] != 'N/A']
     
     df_fat = df_retencao.groupby('Tipo_Cliente')['total_amount'].sum().reset_index(name='Faturamento')
-    df_ped = df_retencao.groupby('Tipo_Cliente').size().reset_index(name='Pedidos')
+    df_ped = df_retencao.groupby('Tipo_Cliente')['vendas'].sum().reset_index(name='Pedidos')
     
     col1, col2 = st.columns(2)
     with col1:
@@ -150,8 +146,7 @@ def exibir_analise_retencao(df):
 def exibir_curva_e_top_clientes(df):
     st.header("3. Curva de Lealdade e Clientes de Alto Valor")
     
-    df_trabalho = df.copy()
-    df_frequencia = df_trabalho.groupby('customer_id').size().reset_index(name='Contagem_Pedidos')
+    df_frequencia = df.groupby('customer_id')['vendas'].sum().reset_index(name='Contagem_Pedidos')
     bins = [0, 1, 2, 3, 5, df_frequencia['Contagem_Pedidos'].max() + 1]
     labels = ['<1 Compra', '1 Compra', '2 Compras', '3 a 5 Compras', '5+ Compras']
     
@@ -161,20 +156,23 @@ def exibir_curva_e_top_clientes(df):
     fig_curva = px.bar(df_curva, x='Faixa', y='Clientes', title='Distribuição de Clientes por Frequência')
     st.plotly_chart(fig_curva, use_container_width=True)
     
-    df_identificados = df_trabalho[df_trabalho['customer_id'].notna()].copy()
-    df_identificados[['customer_name', 'customer_phone']] = df_identificados[['customer_name', 'customer_phone']].fillna({
-    'customer_name': 'Sem cadastro',
-    'customer_phone': 'Não informado'
-    })
 # Agrupar por cliente, somar gastos e obter top 10
     df_top10 = (
-        df_identificados
-        .groupby(['customer_id', 'customer_name', 'customer_phone'])['total_amount']
+        df[df['customer_id'].notna()]
+        .groupby('customer_id')['total_amount']
         .sum()
         .reset_index(name='Gasto Total')
         .sort_values('Gasto Total', ascending=False)
         .head(10)
+        .reset_index(drop=True)
     )
+    # nome e telefone só para as 10 linhas exibidas
+    df_top10 = rotular(df_top10, ['customer_name', 'customer_phone'])
+    df_top10[['customer_name', 'customer_phone']] = df_top10[['customer_name', 'customer_phone']].fillna({
+    'customer_name': 'Sem cadastro',
+    'customer_phone': 'Não informado'
+    })
+    df_top10 = df_top10[['customer_id', 'customer_name', 'customer_phone', 'Gasto Total']]
     
     df_top10 = df_top10.rename(columns={
         'customer_id': 'ID Cliente',
@@ -187,26 +185,54 @@ def exibir_curva_e_top_clientes(df):
     st.subheader("Top 10 Clientes por Faturamento")
     st.dataframe(df_top10, use_container_width=True, hide_index=True)
 
+
+
+# RFM e coortes: base inteira de clientes, recalculados uma vez por atualização dos dados
+def exibir_rfm_e_coortes():
+    st.header("4. Segmentação RFM e Retenção por Coorte")
+    st.caption("Considera todas as vendas concluídas da base, independente do período selecionado.")
     
+    df_rfm = analise_rfm()
+    df_segmentos = df_rfm.groupby('segmento').agg(Clientes=('RFM', 'size'), Faturamento=('valor', 'sum')).reset_index()
+    df_segmentos = df_segmentos.sort_values('Faturamento', ascending=False)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_seg = px.bar(df_segmentos, x='segmento', y='Clientes', title='Clientes por Segmento RFM',
+                         color_discrete_sequence=['#4A148C'])
+        st.plotly_chart(fig_seg, use_container_width=True)
+    with col2:
+        fig_seg_fat = px.bar(df_segmentos, x='segmento', y='Faturamento', title='Faturamento por Segmento RFM',
+                             color_discrete_sequence=['#3498DB'])
+        fig_seg_fat.update_yaxes(tickprefix='R$ ')
+        st.plotly_chart(fig_seg_fat, use_container_width=True)
+    
+    df_coortes = matriz_coortes()
+    if not df_coortes.empty:
+        fig_coortes = px.imshow(df_coortes * 100, text_auto='.0f', aspect='auto', color_continuous_scale='Purples',
+                                labels={'x': 'Meses desde a primeira compra', 'y': 'Coorte (mês da primeira compra)', 'color': '% ativos'},
+                                title='Retenção Mensal por Coorte de Aquisição (%)')
+        st.plotly_chart(fig_coortes, use_container_width=True)
+
     
 def app():
     st.sidebar.header("Filtros de Análise")
     
-    df = carregar_dados()
-    df_filtrado, data_inicio, data_fim = aplicar_filtros(df)
+    data_inicio, data_fim = aplicar_filtros()
     
     st.title("Análise e Segmentação de Clientes (CRM)")
     st.subheader(f"Período: {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}")
     st.markdown("---")
     
-    df_com_metricas = calcular_metricas_clientes(df_filtrado, data_inicio, data_fim)
-    kpis = calcular_kpis(df_com_metricas)
+    df_com_metricas, kpis = preparar_clientes(data_inicio, data_fim)
     
     exibir_kpis_e_distribuicao(df_com_metricas, kpis)
     st.markdown("---")
     exibir_analise_retencao(df_com_metricas)
     st.markdown("---")
     exibir_curva_e_top_clientes(df_com_metricas[df_com_metricas['Tipo_Cliente'] != 'N/A'])
+    st.markdown("---")
+    exibir_rfm_e_coortes()
 
 
 if __name__ == "__main__":
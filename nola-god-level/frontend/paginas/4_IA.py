@@ -1,21 +1,35 @@
-import json
 import os
-import pandas as pd
-import requests
 import streamlit as st
 from dotenv import load_dotenv
-from backend.carregador_dados import dados_vendas_cache, dados_itens_cache
-from backend.logica_IA import gerar_contexto_analise, SCHEMA_DB_DESCRIPTION
+from backend import cache_ia, cliente_llm, prompt_ia
+from backend.agregacao import limites_periodo
+from backend.visoes import vendas_concluidas
+from backend.logica_IA import contexto_analise
 load_dotenv()
 
 
+# trocar o período reexecuta só este trecho: guarda o período escolhido e já deixa o contexto dele
+# pronto (memoizado), sem redesenhar a conversa
+@st.fragment
+def selecionar_periodo():
+    data_minima, data_maxima = limites_periodo()
+    periodo_selecionado = st.sidebar.date_input(
+        "Período para Contexto da IA:",
+        (data_minima, data_maxima),
+        data_minima,
+        data_maxima,
+        key="ia_periodo",
+    )
+    periodo = periodo_selecionado if len(periodo_selecionado) == 2 else (data_minima, data_maxima)
+    st.session_state.periodo_contexto_ia = periodo
+    contexto_analise(*periodo)
+
+
 def app():
     st.title("Assistente de Análise Estratégica com IA")
     st.markdown("Use o assistente para insights em vendas, CRM e marketing, com Gemini e busca Google.")
     st.markdown("---")
 
-    GEMINI_MODEL = "gemini-2.5-flash-preview-09-2025"
-    API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
     api_key = os.getenv("GEMINI_API_KEY")
 
     if not api_key:
@@ -25,58 +39,22 @@ def app():
     if "messages_ia" not in st.session_state:
         st.session_state.messages_ia = []
 
-    df_vendas = dados_vendas_cache()
-    if df_vendas.empty:
+    df_vendas_concluidas = vendas_concluidas()
+    if df_vendas_concluidas.empty:
         return
-    df_vendas['sale_date'] = pd.to_datetime(df_vendas['created_at']).dt.date
-    df_vendas_concluidas = df_vendas[df_vendas['sale_status_desc'] == 'COMPLETED']
 
-    df_itens = dados_itens_cache()
-    df_itens_concluidos = df_itens[df_itens['sale_status_desc'] == 'COMPLETED']
+    selecionar_periodo()
+    data_inicio_ia, data_fim_ia = st.session_state.periodo_contexto_ia
 
-    data_minima, data_maxima = df_vendas_concluidas['sale_date'].min(), df_vendas_concluidas['sale_date'].max()
-    periodo_selecionado = st.sidebar.date_input(
-        "Período para Contexto da IA:",
-        (data_minima, data_maxima),
-        data_minima,
-        data_maxima,
-        key="ia_periodo",
-    )
-    data_inicio_ia, data_fim_ia = (
-        periodo_selecionado if len(periodo_selecionado) == 2 else (data_minima, data_maxima)
-    )
+    if "estado_prompt_ia" not in st.session_state:
+        st.session_state.estado_prompt_ia = {}
 
-    def get_gemini_response(prompt, context_data_dict):
-        context_json = json.dumps(context_data_dict, indent=2)
-        system_instruction = f"""
-        Você é um Analista de Marketing e CRM Estratégico sênior. Analise os dados fornecidos e responda em português, profissionalmente.
-        Use busca Google para tendências. Mantenha respostas concisas e focadas em crescimento.
-        Schema: {SCHEMA_DB_DESCRIPTION}
-        Contexto: {context_json}
-        """
-
-        contents = [
-            {"role": msg["role"], "parts": [{"text": str(msg["content"])}]}
-            for msg in st.session_state.messages_ia
-        ]
-        contents.append({"role": "user", "parts": [{"text": prompt}]})
-
-        payload = {
-            "contents": contents,
-            "tools": [{"google_search": {}}],
-            "systemInstruction": {"parts": [{"text": system_instruction}]},
-        }
-
-        response = requests.post(
-            f"{API_URL}?key={api_key}",
-            headers={'Content-Type': 'application/json'},
-            data=json.dumps(payload),
+    def formatar_fontes(sources):
+        if not sources:
+            return ""
+        return prompt_ia.MARCADOR_FONTES + "\n".join(
+            f"- [{s['web']['title']}]({s['web']['uri']})" for s in sources if s.get('web')
         )
-        response.raise_for_status()
-        result = response.json()
-        text = result['candidates'][0]['content']['parts'][0]['text']
-        sources = result['candidates'][0].get('groundingMetadata', {}).get('groundingAttributions', [])
-        return text, sources
 
     for message in st.session_state.messages_ia:
         with st.chat_message(message["role"]):
@@ -90,18 +68,36 @@ def app():
         with st.spinner(
             f"Calculando KPIs para {data_inicio_ia.strftime('%d/%m/%Y')} a {data_fim_ia.strftime('%d/%m/%Y')}..."
         ):
-            context_json = gerar_contexto_analise(
-                df_vendas_concluidas, df_itens_concluidos, data_inicio_ia, data_fim_ia
-            )
-            context_data = json.loads(context_json)
+            context_json = contexto_analise(data_inicio_ia, data_fim_ia)
+
+        # mesma pergunta + mesma conversa + mesmo contexto = mesma resposta, sem nova chamada ao Gemini
+        chave = cache_ia.chave_resposta(prompt, st.session_state.messages_ia[:-1], context_json, cliente_llm.GEMINI_MODEL)
+        em_cache = cache_ia.obter(chave)
 
         with st.chat_message("model"):
-            with st.spinner("Gerando análise com Gemini..."):
-                response_text, sources = get_gemini_response(prompt, context_data)
-                full_response = response_text
-                if sources:
-                    full_response += "\n\n---\n**Referências:**\n" + "\n".join(
-                        f"- [{s['web']['title']}]({s['web']['uri']})" for s in sources if s.get('web')
-                    )
+            if em_cache is not None:
+                response_text, sources = em_cache
+                full_response = response_text + formatar_fontes(sources)
                 st.markdown(full_response)
-                st.session_state.messages_ia.append({"role": "model", "content": full_response})
+                st.caption("⚡ Resposta do cache (pergunta repetida sobre o mesmo contexto).")
+            else:
+                # o texto aparece conforme o Gemini gera, em vez de esperar a resposta inteira
+                try:
+                    with st.spinner("Conectando ao Gemini..."):
+                        # histórico sem a pergunta atual (já anexada acima), compactado no orçamento de tokens
+                        payload = prompt_ia.montar_payload(
+                            prompt, st.session_state.messages_ia[:-1], context_json,
+                            api_key, st.session_state.estado_prompt_ia,
+                        )
+                        stream = cliente_llm.gerar_stream(payload, api_key)
+                    response_text = st.write_stream(stream)
+                except cliente_llm.ErroLLM as erro:
+                    st.error(f"Não foi possível obter a resposta do assistente. {erro}")
+                    st.session_state.messages_ia.pop()
+                    return
+                response_text, sources = stream.texto, stream.fontes
+                cache_ia.guardar(chave, response_text, sources)
+                full_response = response_text + formatar_fontes(sources)
+                if sources:
+                    st.markdown(formatar_fontes(sources))
+            st.session_state.messages_ia.append({"role": "model", "content": full_response})
@@ -0,0 +1,24 @@
+import pytest
+
+from backend.agregacao import _validar
+
+
+def test_validar_ordenacao_pelo_resultado():
+    _validar(["faturamento"], ["store_id"], {}, "faturamento")
+    _validar(["faturamento"], ["store_id"], {}, "store_id")
+    _validar(["ticket_medio"], [], {}, "ticket_medio")
+
+
+@pytest.mark.parametrize("ordenar_por", ["vendas", "faturamento; DROP TABLE sales", "1"])
+def test_validar_recusa_ordenacao_fora_do_resultado(ordenar_por):
+    with pytest.raises(ValueError):
+        _validar(["faturamento"], ["store_id"], {}, ordenar_por)
+
+
+def test_validar_recusa_metrica_e_dimensao_desconhecidas():
+    with pytest.raises(ValueError):
+        _validar(["lucro"], [], {})
+    with pytest.raises(ValueError):
+        _validar(["vendas"], ["cor"], {})
+    with pytest.raises(ValueError):
+        _validar(["vendas"], [], {"cor": 1})
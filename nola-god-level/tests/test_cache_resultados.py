@@ -0,0 +1,112 @@
+import pandas as pd
+import pytest
+
+from backend import cache_resultados
+from backend.cache_resultados import _CacheResultados, _tamanho, estatisticas, memoizar
+
+
+@pytest.fixture(autouse=True)
+def cache_limpo():
+    cache_resultados._cache_resultados.clear()
+    yield
+    cache_resultados._cache_resultados.clear()
+
+
+def _frame(linhas):
+    return pd.DataFrame({"valor": range(linhas)})
+
+
+def test_lru_por_numero_de_entradas(monkeypatch):
+    monkeypatch.setattr(cache_resultados, "CACHE_RESULTADOS_ENTRADAS", 3)
+    cache = _CacheResultados()
+    for chave in "abc":
+        cache.guardar(chave, chave)
+    cache.obter("a", "p")  # "a" passa a ser a mais recente: "b" é a próxima a sair
+    cache.guardar("d", "d")
+    assert list(cache.entradas) == ["c", "a", "d"]
+
+
+def test_lru_por_memoria(monkeypatch):
+    tamanho = _tamanho(_frame(1000))
+    monkeypatch.setattr(cache_resultados, "CACHE_RESULTADOS_MB", 2.5 * tamanho / 1024 ** 2)
+    cache = _CacheResultados()
+    for chave in "abc":
+        cache.guardar(chave, _frame(1000))
+    assert list(cache.entradas) == ["b", "c"]
+    assert cache.bytes == 2 * tamanho
+
+    # maior que o limite inteiro: não é guardado e não derruba ninguém
+    cache.guardar("grande", _frame(10_000))
+    assert list(cache.entradas) == ["b", "c"]
+
+
+def test_regravar_chave_nao_conta_duas_vezes():
+    cache = _CacheResultados()
+    cache.guardar("a", _frame(10))
+    cache.guardar("a", _frame(10))
+    assert len(cache.entradas) == 1
+    assert cache.bytes == _tamanho(_frame(10))
+
+
+def test_memoizar_por_versao():
+    versao = {"atual": 1}
+    chamadas = []
+
+    @memoizar("teste", lambda: versao["atual"])
+    def calcular(periodo, filtros):
+        chamadas.append((periodo, filtros))
+        return _frame(5)
+
+    calcular((1, 2), {"b": [1, 2], "a": 1})
+    calcular((1, 2), {"a": 1, "b": [1, 2]})  # mesmos filtros em outra ordem: acerto
+    assert len(chamadas) == 1
+    calcular((1, 3), {"a": 1, "b": [1, 2]})
+    assert len(chamadas) == 2
+
+    versao["atual"] = 2  # dados novos: as entradas da versão anterior não servem mais
+    calcular((1, 2), {"a": 1, "b": [1, 2]})
+    assert len(chamadas) == 3
+    assert estatisticas()["paginas"]["teste"] == (1, 3)
+
+
+def test_memoizar_devolve_copia():
+    @memoizar("teste", lambda: 1)
+    def calcular():
+        return _frame(5)
+
+    primeiro = calcular()
+    primeiro["nova"] = 1
+    primeiro.loc[0, "valor"] = 99
+    resultado = calcular()
+    assert primeiro.loc[0, "valor"] == 99
+    assert "nova" not in resultado.columns
+    assert resultado.loc[0, "valor"] == 0
+
+
+def test_memoizar_argumento_sem_hash_nao_guarda():
+    chamadas = []
+
+    @memoizar("teste", lambda: 1)
+    def calcular(df):
+        chamadas.append(1)
+        return len(df)
+
+    calcular(_frame(3))
+    calcular(_frame(3))
+    assert len(chamadas) == 2
+    assert estatisticas()["entradas"] == 0
+
+
+def test_limite_zero_desliga(monkeypatch):
+    monkeypatch.setattr(cache_resultados, "CACHE_RESULTADOS_MB", 0)
+    chamadas = []
+
+    @memoizar("teste", lambda: 1)
+    def calcular():
+        chamadas.append(1)
+        return _frame(5)
+
+    calcular()
+    calcular()
+    assert len(chamadas) == 2
+    assert estatisticas()["entradas"] == 0
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from backend.cubo import CHAVES_CUBO, _celulas, _CuboVendas
+from backend.esquema import EPOCA, ESQUEMA_VENDAS, MONETARIAS_VENDAS, aplicar_esquema, concatenar
+
+STATUS = ["COMPLETED", "CANCELLED"]
+
+
+def _vendas(rng, ids, dia_inicial=20000, dias=30):
+    """Frame de vendas no esquema compacto do carregador (com canais nulos, como no banco)."""
+    n = len(ids)
+    canais = pd.array(rng.integers(1, 4, n), dtype="Int32")
+    canais[rng.random(n) < 0.05] = pd.NA
+    bruto = pd.DataFrame({
+        "id": ids,
+        "store_id": rng.integers(1, 6, n),
+        "channel_id": canais,
+        "created_at": EPOCA + pd.to_timedelta(dia_inicial + rng.integers(0, dias, n), unit="D")
+                      + pd.to_timedelta(rng.integers(0, 24 * 60, n), unit="min"),
+        "sale_status_desc": rng.choice(STATUS, n, p=[0.9, 0.1]),
+        "total_amount": rng.uniform(10, 200, n).round(2),
+        "total_discount": rng.uniform(0, 10, n).round(2),
+        "delivery_fee": rng.uniform(0, 8, n).round(2),
+        "customer_id": rng.integers(1, 50, n),
+        "customer_name_venda": None,
+    })
+    df = aplicar_esquema(bruto, ESQUEMA_VENDAS, MONETARIAS_VENDAS, "created_at")
+    return df.sort_values("created_at", kind="stable", ignore_index=True)
+
+
+def _incremental(atual, delta):
+    # mesma mesclagem de _CacheIncremental.carga_incremental
+    substituir = atual["id"].isin(delta["id"].unique())
+    removidas = atual[substituir]
+    df = concatenar([atual[~substituir], delta]).sort_values("created_at", kind="stable", ignore_index=True)
+    return df, removidas
+
+
+def _normalizar(celulas):
+    celulas = celulas.astype({"sale_status_desc": "object"})
+    return celulas.sort_values(CHAVES_CUBO, ignore_index=True)
+
+
+def test_atualizacao_incremental_igual_a_reconstrucao():
+    rng = np.random.default_rng(7)
+    df = _vendas(rng, np.arange(1, 2001))
+    cubo = _CuboVendas()
+    cubo.atualizar(df, None, None)
+
+    proximo_id = 2001
+    for _ in range(5):
+        # vendas re-buscadas (status e valores mudam) + vendas novas nos dias mais recentes
+        rebuscadas = rng.choice(df["id"].to_numpy(dtype="int64"), 150, replace=False)
+        novas = np.arange(proximo_id, proximo_id + 200)
+        proximo_id += 200
+        delta = _vendas(rng, np.concatenate([rebuscadas, novas]), dia_inicial=20020, dias=15)
+        df, removidas = _incremental(df, delta)
+        versao = cubo.versao
+        cubo.atualizar(df, removidas, delta)
+        assert cubo.versao == versao + 1
+
+    pdt.assert_frame_equal(_normalizar(cubo.celulas), _normalizar(_celulas(df)), check_dtype=False)
+
+
+def test_celula_zerada_sai_do_cubo():
+    rng = np.random.default_rng(11)
+    df = _vendas(rng, np.arange(1, 301))
+    cubo = _CuboVendas()
+    cubo.atualizar(df, None, None)
+
+    # a única venda de uma célula muda de status: a célula antiga fica com zero vendas e é descartada
+    venda = df.iloc[[0]]
+    delta = venda.assign(sale_status_desc=pd.Categorical(
+        ["CANCELLED" if venda["sale_status_desc"].iloc[0] == "COMPLETED" else "COMPLETED"]))
+    df, removidas = _incremental(df, delta)
+    cubo.atualizar(df, removidas, delta)
+
+    assert (cubo.celulas["vendas"] > 0).all()
+    pdt.assert_frame_equal(_normalizar(cubo.celulas), _normalizar(_celulas(df)), check_dtype=False)
+
+
+def test_tabelas_guardadas_descartadas_na_atualizacao():
+    rng = np.random.default_rng(3)
+    df = _vendas(rng, np.arange(1, 501))
+    cubo = _CuboVendas()
+    cubo.atualizar(df, None, None)
+    antes = cubo.tabela(None, {"store_id": 1})
+    assert cubo.tabela(None, {"store_id": 1}) is antes
+
+    delta = _vendas(rng, np.arange(501, 601))
+    df, removidas = _incremental(df, delta)
+    cubo.atualizar(df, removidas, delta)
+    depois = cubo.tabela(None, {"store_id": 1})
+    assert depois is not antes
+    assert depois.agregar({"vendas": "vendas"})["vendas"].iloc[0] == (df["store_id"] == 1).sum()
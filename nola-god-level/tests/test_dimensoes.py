@@ -0,0 +1,43 @@
+import threading
+
+import pandas as pd
+
+from backend import dimensoes
+from backend.dimensoes import _CacheDimensao
+
+
+def _cache(monkeypatch, liberar):
+    lidas = []
+
+    def ler(sql, con):
+        lidas.append(sql)
+        liberar.wait(5)
+        return pd.DataFrame({"store_id": [1, 2], "store_name": ["A", "B"]})
+
+    monkeypatch.setattr(dimensoes.pd, "read_sql_query", ler)
+    return _CacheDimensao("lojas", "SELECT 1", "store_id"), lidas
+
+
+def test_obter_sem_esperar_nao_dispara_carga(monkeypatch):
+    liberar = threading.Event()
+    liberar.set()
+    cache, lidas = _cache(monkeypatch, liberar)
+    assert cache.obter(esperar=False) is None
+    assert lidas == []
+    assert cache.obter()["store_name"].tolist() == ["A", "B"]
+    assert cache.obter(esperar=False) is cache.df
+
+
+def test_obter_sem_esperar_durante_a_primeira_carga(monkeypatch):
+    liberar = threading.Event()
+    cache, lidas = _cache(monkeypatch, liberar)
+    carga = threading.Thread(target=cache.obter)
+    carga.start()
+    while not lidas:
+        pass
+    # a carga está presa no banco: quem não quer esperar volta na hora
+    assert cache.obter(esperar=False) is None
+    liberar.set()
+    carga.join()
+    assert len(cache.obter(esperar=False)) == 2
+    assert len(lidas) == 1
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+from backend import extracao_copy
+from backend.extracao_copy import ler_lotes_copy
+
+
+class _Cursor:
+    """Cursor falso: o COPY escreve CSV no pipe até acabar ou ser cancelado."""
+
+    connection = type("Conexao", (), {"encoding": "UTF8"})()
+
+    def __init__(self, conexao, linhas):
+        self.conexao = conexao
+        self.linhas = linhas
+
+    def mogrify(self, consulta, params):
+        return consulta.encode()
+
+    def copy_expert(self, comando, destino):
+        try:
+            destino.write(b"id,valor\n")
+            for i in range(self.linhas):
+                if self.conexao.cancelada:
+                    raise RuntimeError("canceling statement due to user request")
+                destino.write(f"{i},{i}.5\n".encode())
+        finally:
+            time.sleep(0.1)  # ainda usando o cursor depois do fim da escrita
+            self.conexao.eventos.append("fim do copy")
+
+
+class _Conexao:
+    def __init__(self, linhas):
+        self.linhas = linhas
+        self.cancelada = False
+        self.eventos = []
+
+    def cursor(self):
+        return _Cursor(self, self.linhas)
+
+    def cancel(self):
+        self.cancelada = True
+        self.eventos.append("cancel")
+
+    def close(self):
+        self.eventos.append("close")
+
+
+def _engine(monkeypatch, conexao):
+    engine = create_engine("postgresql+psycopg2://teste@localhost/teste")
+    monkeypatch.setattr(engine, "raw_connection", lambda: conexao)
+    monkeypatch.setattr(extracao_copy, "TAMANHO_BLOCO_COPY", 1 << 16)
+    return engine
+
+
+def test_leitura_completa(monkeypatch):
+    conexao = _Conexao(1000)
+    lotes = list(ler_lotes_copy(_engine(monkeypatch, conexao), "SELECT 1", tipos={"id": "int64"}))
+    assert sum(len(lote) for lote in lotes) == 1000
+    assert conexao.eventos == ["fim do copy", "close"]
+
+
+def test_gerador_fechado_cancela_antes_de_fechar(monkeypatch):
+    conexao = _Conexao(10 ** 8)
+    lotes = ler_lotes_copy(_engine(monkeypatch, conexao), "SELECT 1", tipos={"id": "int64"})
+    assert len(next(lotes)) > 0
+    lotes.close()
+    # a conexão só é fechada depois que a thread do COPY larga o cursor
+    assert conexao.eventos == ["cancel", "fim do copy", "close"]
+    assert not any(t.name == "copy-produtor" for t in threading.enumerate())
@@ -0,0 +1,65 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import graficos
+from backend.graficos import escolher_granularidade, grafico_linha, lttb
+
+
+@pytest.mark.parametrize("total, n", [(10_000, 1500), (1000, 3), (101, 100)])
+def test_lttb_primeiro_ultimo_e_quantidade(total, n):
+    rng = np.random.default_rng(1)
+    x = np.arange(total, dtype="float64")
+    indices = lttb(x, rng.normal(size=total), n)
+    assert len(indices) == n
+    assert indices[0] == 0 and indices[-1] == total - 1
+    assert (np.diff(indices) > 0).all()  # ordenados, sem repetição
+
+
+@pytest.mark.parametrize("total, n", [(500, 500), (500, 800), (50, 2)])
+def test_lttb_nao_reduz_sem_necessidade(total, n):
+    # n >= total devolve tudo; n < 3 não forma triângulos e também devolve tudo
+    assert lttb(np.arange(total, dtype="float64"), np.zeros(total), n).tolist() == list(range(total))
+
+
+def test_lttb_mantem_picos():
+    y = np.zeros(5000)
+    y[1234], y[3210] = 100, -100
+    indices = lttb(np.arange(5000, dtype="float64"), y, 50)
+    assert 1234 in indices and 3210 in indices
+
+
+def _serie(pontos):
+    return pd.DataFrame({
+        "data": pd.date_range("2024-01-01", periods=pontos, freq="h"),
+        "Faturamento": np.random.default_rng(2).uniform(0, 100, pontos),
+    })
+
+
+def test_grafico_linha_reduz_e_usa_webgl(monkeypatch):
+    monkeypatch.setattr(graficos, "PONTOS_MAX_GRAFICO", 300)
+    monkeypatch.setattr(graficos, "LIMITE_WEBGL_GRAFICO", 200)
+    fig = grafico_linha(_serie(2000), x="data", y="Faturamento", line_shape="spline")
+    traco = fig.data[0]
+    assert len(traco.x) == 300
+    assert traco.type == "scattergl"
+    assert traco.line.shape != "spline"  # o scattergl não desenha spline
+
+
+def test_grafico_linha_pequeno_sem_mudanca(monkeypatch):
+    monkeypatch.setattr(graficos, "PONTOS_MAX_GRAFICO", 300)
+    monkeypatch.setattr(graficos, "LIMITE_WEBGL_GRAFICO", 200)
+    fig = grafico_linha(_serie(150), x="data", y="Faturamento", line_shape="spline")
+    traco = fig.data[0]
+    assert len(traco.x) == 150
+    assert traco.type == "scatter"
+    assert traco.line.shape == "spline"
+
+
+@pytest.mark.parametrize("dias, esperado", [(1, "hora"), (3, "hora"), (4, "dia"), (400, "dia"),
+                                            (401, "semana"), (3 * 365, "semana"), (3 * 365 + 1, "mes")])
+def test_escolher_granularidade(dias, esperado):
+    inicio = date(2020, 1, 1)
+    assert escolher_granularidade((inicio, inicio + pd.Timedelta(days=dias - 1))) == esperado
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from backend import metricas
+from backend.metricas import TabelaFatorada
+
+
+def _frame(rng, n, cardinalidade):
+    """Chaves category, inteira anulável e inteira; medidas inteira e float com nulos."""
+    inteira = pd.array(rng.integers(0, cardinalidade, n), dtype="Int64")
+    inteira[rng.random(n) < 0.05] = pd.NA
+    valor = rng.uniform(0, 100, n)
+    valor[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        "categoria": pd.Categorical(rng.choice(["a", "b", "c", None], n)),
+        "inteira": inteira,
+        "codigo": rng.integers(0, cardinalidade, n),
+        "centavos": rng.integers(0, 10_000, n),
+        "valor": valor,
+    })
+
+
+def _esperado(df, chaves, dropna):
+    esperado = df.groupby(chaves, dropna=dropna, observed=True).agg(
+        centavos=("centavos", "sum"), valor=("valor", "sum"), vendas=("centavos", "size")).reset_index()
+    return esperado.sort_values(chaves, ignore_index=True)
+
+
+def _obtido(df, chaves, dropna):
+    obtido = TabelaFatorada(df).agregar({"centavos": "centavos", "valor": "valor", "vendas": None}, chaves, dropna)
+    return obtido.sort_values(chaves, ignore_index=True)
+
+
+def _comparar(obtido, esperado, chaves):
+    # as chaves voltam com o tipo dos valores distintos (category vira os próprios valores)
+    obtido = obtido.astype({c: "object" for c in chaves})
+    esperado = esperado.astype({c: "object" for c in chaves})
+    pdt.assert_frame_equal(obtido, esperado, check_dtype=False)
+
+
+@pytest.mark.parametrize("dropna", [True, False])
+@pytest.mark.parametrize("chaves", [["categoria"], ["inteira"], ["categoria", "inteira", "codigo"]])
+def test_agregar_igual_ao_groupby(chaves, dropna):
+    df = _frame(np.random.default_rng(1), 5000, 20)
+    _comparar(_obtido(df, chaves, dropna), _esperado(df, chaves, dropna), chaves)
+
+
+@pytest.mark.parametrize("dropna", [True, False])
+def test_agregar_acima_do_limite_denso(dropna):
+    # (2500 + 1)² combinações passam de LIMITE_DENSO: os grupos saem do np.unique
+    df = _frame(np.random.default_rng(2), 20_000, 2500)
+    chaves = ["inteira", "codigo"]
+    assert (df["inteira"].nunique() + 1) * (df["codigo"].nunique() + 1) > metricas.LIMITE_DENSO
+    _comparar(_obtido(df, chaves, dropna), _esperado(df, chaves, dropna), chaves)
+
+
+def test_caminhos_denso_e_esparso_iguais(monkeypatch):
+    df = _frame(np.random.default_rng(3), 3000, 15)
+    chaves = ["categoria", "codigo"]
+    denso = _obtido(df, chaves, False)
+    monkeypatch.setattr(metricas, "LIMITE_DENSO", 0)
+    pdt.assert_frame_equal(_obtido(df, chaves, False), denso)
+
+
+def test_agregar_sem_chaves():
+    df = _frame(np.random.default_rng(4), 1000, 10)
+    total = TabelaFatorada(df).agregar({"centavos": "centavos", "valor": "valor", "vendas": None})
+    assert total.at[0, "centavos"] == df["centavos"].sum()
+    assert total.at[0, "valor"] == pytest.approx(df["valor"].sum())
+    assert total.at[0, "vendas"] == len(df)
+
+
+def test_derivar_e_filtrar():
+    df = _frame(np.random.default_rng(5), 2000, 30)
+    tabela = TabelaFatorada(df)
+    tabela.derivar("paridade", "codigo", lambda valores: valores % 2)
+    tabela = tabela.filtrar(tabela.mascara("categoria", ["a", "b"]))
+
+    filtrado = df[df["categoria"].isin(["a", "b"])]
+    esperado = filtrado.groupby(filtrado["codigo"] % 2).agg(centavos=("centavos", "sum")).reset_index()
+    obtido = tabela.agregar({"centavos": "centavos"}, ["paridade"])
+    assert obtido["paridade"].tolist() == esperado["codigo"].tolist()
+    assert obtido["centavos"].tolist() == esperado["centavos"].tolist()